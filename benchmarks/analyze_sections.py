@@ -0,0 +1,58 @@
+"""
+Compares the per-cell loop that analyze_sections used to run with the
+integral-image implementation in analysis.section_white_ratios.
+
+    python benchmarks/analyze_sections.py
+"""
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from analysis import section_white_ratios  # noqa: E402
+
+SIZES = [(500, 500), (1000, 1000), (2000, 1500), (4000, 3000)]
+GRIDS = [(4, 4), (10, 10), (40, 40)]
+WHITE_THRESHOLD = 200
+REPEAT = 5
+
+
+def section_white_ratios_loop(gray, grid, white_threshold):
+    height, width = gray.shape[:2]
+    rows, cols = grid
+    section_height = height // rows
+    section_width = width // cols
+
+    ratios = np.zeros(grid)
+    for row in range(rows):
+        for col in range(cols):
+            section = gray[row * section_height:(row + 1) * section_height,
+                           col * section_width:(col + 1) * section_width]
+            white_pixels = cv2.countNonZero(cv2.threshold(section, white_threshold, 255, cv2.THRESH_BINARY)[1])
+            ratios[row, col] = white_pixels / section.size
+
+    return ratios
+
+
+def best_ms(fn, *args):
+    number = 3
+    return min(timeit.repeat(lambda: fn(*args), number=number, repeat=REPEAT)) / number * 1000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'size':>10} {'grid':>6} {'loop ms':>9} {'vector ms':>10} {'speedup':>8}")
+    for width, height in SIZES:
+        gray = rng.integers(0, 256, (height, width), dtype=np.uint8)
+        for grid in GRIDS:
+            loop = best_ms(section_white_ratios_loop, gray, grid, WHITE_THRESHOLD)
+            vector = best_ms(section_white_ratios, gray, grid, WHITE_THRESHOLD)
+            print(f"{width}x{height:<5} {grid[0]}x{grid[1]:<3} {loop:9.2f} {vector:10.2f} {loop / vector:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
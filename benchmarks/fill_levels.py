@@ -0,0 +1,106 @@
+"""
+Seeds 90 days of fill-level history for 100 floors and 6 linen types
+(a sample every 6 hours) and times the chart queries: the daily and hourly
+rollups through `GET /inventory/fill_levels`, cold and from the response
+cache, against aggregating the raw samples with GROUP BY.
+
+    python benchmarks/fill_levels.py
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+
+from harness import HEADERS, create_app
+from cache import response_cache
+from blueprints.models import FillLevelSample
+from blueprints.services import FillLevelService
+from database import db
+
+FLOORS = 100
+LINEN_TYPES = 6
+DAYS = 90
+SAMPLES_PER_DAY = 4
+CELLS = 16
+REPEAT = 5
+END = datetime(2025, 4, 1)
+
+
+def seed():
+    rng = random.Random(0)
+    image_id = 0
+    for day in range(DAYS):
+        samples = []
+        for i in range(SAMPLES_PER_DAY):
+            timestamp = END - timedelta(days=DAYS - day) + timedelta(hours=24 * i / SAMPLES_PER_DAY)
+            for floor_id in range(1, FLOORS + 1):
+                image_id += 1
+                for ltype_id in range(1, LINEN_TYPES + 1):
+                    quantity = rng.randint(0, CELLS)
+                    samples.append({
+                        'floor_id': floor_id, 'ltype_id': ltype_id, 'image_id': image_id, 'timestamp': timestamp,
+                        'quantity': quantity, 'cells': CELLS, 'fill': quantity / CELLS,
+                    })
+        db.session.execute(insert(FillLevelSample), samples)
+        FillLevelService.roll_up(samples)
+        db.session.commit()
+
+
+def raw_daily_series(start, end):
+    day = func.date(FillLevelSample.timestamp)
+    return db.session.query(
+        FillLevelSample.floor_id, FillLevelSample.ltype_id, day, func.count(), func.sum(FillLevelSample.quantity),
+        func.min(FillLevelSample.quantity), func.max(FillLevelSample.quantity), func.sum(FillLevelSample.fill),
+    ).filter(
+        FillLevelSample.timestamp >= start, FillLevelSample.timestamp < end,
+    ).group_by(FillLevelSample.floor_id, FillLevelSample.ltype_id, day).order_by(
+        FillLevelSample.floor_id, FillLevelSample.ltype_id, day,
+    ).all()
+
+
+def best_ms(fn, cold=False):
+    timings = []
+    for _ in range(REPEAT):
+        if cold:
+            response_cache.clear()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        started = time.perf_counter()
+        seed()
+        print(f"Seeded {FillLevelSample.query.count()} samples in {time.perf_counter() - started:.1f}s")
+
+    start = END - timedelta(days=DAYS)
+    span = f"from={start.isoformat()}&to={END.isoformat()}"
+
+    def get(path):
+        response = client.get(path, headers=HEADERS)
+        assert response.status_code == 200, response.status_code
+        return response
+
+    cases = [
+        ("GET daily rollup, all floors", f'/inventory/fill_levels?resolution=day&{span}'),
+        ("GET daily rollup, one linen type", f'/inventory/fill_levels?resolution=day&linenTypeId=1&{span}'),
+        ("GET hourly rollup, one floor", f'/inventory/fill_levels?resolution=hour&floorId=1&{span}'),
+    ]
+    print(f"{'case':<44} {'cold ms':>9} {'cached ms':>9} {'KiB':>7}")
+    for name, path in cases:
+        size = len(get(path).get_data()) / 1024
+        print(f"{name:<44} {best_ms(lambda: get(path), cold=True):9.1f} {best_ms(lambda: get(path)):9.1f} {size:7.0f}")
+
+    with app.app_context():
+        print(f"{'query daily rollup, all floors':<44} "
+              f"{best_ms(lambda: FillLevelService.series('day', start, END)):9.1f}")
+        print(f"{'GROUP BY raw samples, all floors':<44} {best_ms(lambda: raw_daily_series(start, END)):9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Shared setup for the benchmark scripts: builds an isolated app backed by a
+throwaway SQLite database and blob directory, seeds it with floors, and
+starts Gunicorn against such a directory for the out-of-process benchmarks.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+WORK_DIR = tempfile.mkdtemp(prefix='osheet-bench-')
+API_KEY = 'bench'
+
+
+def environment(work_dir=WORK_DIR, **extra):
+    return {
+        **os.environ,
+        'API_KEY': API_KEY,
+        'DATABASE_URI': 'sqlite:///' + os.path.join(work_dir, 'database.db'),
+        'BLOB_STORAGE_PATH': os.path.join(work_dir, 'blobs'),
+        'DERIVATIVE_CACHE_PATH': os.path.join(work_dir, 'derivatives'),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(work_dir, 'metrics'),
+        'ANALYSIS_ENABLED': '0',
+        **extra,
+    }
+
+
+os.environ.update(environment())
+sys.path.insert(0, SRC_PATH)
+
+from app import create_app as create_flask_app  # noqa: E402
+from cache import response_cache  # noqa: E402
+from database import db  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+HEADERS = {'X-Api-Key': API_KEY}
+LINEN_TYPES = ['King', 'Queen', 'Single', 'Towel', 'FaceTowel', 'BathMat']
+
+
+def create_app():
+    app = create_flask_app('sqlite:///' + os.path.join(WORK_DIR, 'database.db'))
+
+    with app.app_context():
+        db.drop_all()
+        migrate()
+    response_cache.clear()
+
+    return app
+
+
+def seed(client, floors, linen_types=LINEN_TYPES, image_base64=None):
+    for name in linen_types:
+        client.post('/linen_type/', headers=HEADERS, json={'name': name})
+
+    for floor_id in range(1, floors + 1):
+        client.post('/floor/', headers=HEADERS, json={'name': f'Floor {floor_id}'})
+        for linen_type_id in range(1, len(linen_types) + 1):
+            client.post(f'/floor/{floor_id}/add_linen', headers=HEADERS,
+                        json={'linen_type_id': linen_type_id})
+        if image_base64:
+            client.post(f'/floor/{floor_id}/update_image', headers=HEADERS,
+                        json={'timestamp': '2025-01-01T08:00:00', 'image_base64': image_base64})
+
+
+def request(port, method, path, body=None, headers=None, timeout=30):
+    """
+    One request to a local server on its own connection; returns the status
+    and body.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers={**HEADERS, **(headers or {})})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def start_server(port, work_dir=WORK_DIR, poll_interval=0.1, **extra):
+    """
+    Starts Gunicorn with src/gunicorn.conf.py against `work_dir`, with
+    `extra` added to its environment, and returns once it serves
+    `GET /floor/`.
+    """
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--chdir', SRC_PATH, '--config', os.path.join(SRC_PATH, 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        env=environment(work_dir, **extra), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if request(port, 'GET', '/floor/', timeout=1)[0] == 200:
+                return server
+        except OSError:
+            time.sleep(poll_interval)
+    server.terminate()
+    server.wait()
+    raise RuntimeError("Gunicorn did not start")
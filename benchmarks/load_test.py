@@ -0,0 +1,145 @@
+"""
+Load test for slow mobile clients: starts Gunicorn on a throwaway database
+once per worker class, opens several uploads that trickle a JPEG in at
+phone-on-hotel-wifi speed, and meanwhile hammers `GET /floor/?summary=1`
+with readers. Reports how many reads got through, their latency, and
+whether the uploads completed.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --worker-classes sync,gthread --uploads 16 --upload-rate 128
+"""
+import argparse
+import io
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from harness import API_KEY, request, start_server
+
+FLOORS = 10
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--worker-classes', default='sync,gthread', help="Comma-separated Gunicorn worker classes")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--uploads', type=int, default=8, help="Concurrent slow uploads")
+    parser.add_argument('--upload-kb', type=int, default=1536, help="Approximate upload size in KiB")
+    parser.add_argument('--upload-rate', type=int, default=256, help="Upload speed per client in KiB/s")
+    parser.add_argument('--readers', type=int, default=8, help="Concurrent readers")
+    parser.add_argument('--read-timeout', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5071)
+    return parser.parse_args(argv)
+
+
+def make_jpeg(kb):
+    rng = np.random.default_rng(0)
+    side = int((kb * 1024) ** 0.5)
+    pixels = rng.integers(0, 256, (side, side, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def slow_upload(port, floor_id, data, rate, results):
+    started = time.monotonic()
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=120) as sock:
+            sock.sendall((
+                f"PUT /floor/{floor_id}/image HTTP/1.1\r\nHost: localhost\r\nX-Api-Key: {API_KEY}\r\n"
+                f"Content-Type: image/jpeg\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n"
+            ).encode('ascii'))
+            chunk_size = 16 * 1024
+            for offset in range(0, len(data), chunk_size):
+                sock.sendall(data[offset:offset + chunk_size])
+                time.sleep(chunk_size / (rate * 1024))
+            status = int(sock.makefile('rb').readline().split()[1])
+        results.append((status == 200, time.monotonic() - started))
+    except OSError:
+        results.append((False, time.monotonic() - started))
+
+
+def reader(port, stop, timeout, latencies, errors):
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            status, _ = request(port, 'GET', '/floor/?summary=1', timeout=timeout)
+            if status != 200:
+                raise OSError(status)
+            latencies.append(time.monotonic() - started)
+        except OSError:
+            errors.append(time.monotonic() - started)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run(args, worker_class, data):
+    work_dir = tempfile.mkdtemp(prefix='osheet-load-')
+    server = start_server(
+        args.port, work_dir, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+    )
+    try:
+        for i in range(FLOORS):
+            request(args.port, 'POST', '/floor/', body=json.dumps({'name': f'Floor {i}'}),
+                    headers={'Content-Type': 'application/json'})
+
+        uploads, latencies, errors = [], [], []
+        stop = threading.Event()
+        readers = [
+            threading.Thread(target=reader, args=(args.port, stop, args.read_timeout, latencies, errors))
+            for _ in range(args.readers)
+        ]
+        uploaders = [
+            threading.Thread(target=slow_upload, args=(args.port, i % FLOORS + 1, data, args.upload_rate, uploads))
+            for i in range(args.uploads)
+        ]
+        started = time.monotonic()
+        for thread in uploaders + readers:
+            thread.start()
+        for thread in uploaders:
+            thread.join()
+        elapsed = time.monotonic() - started
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        return {
+            'worker_class': worker_class,
+            'uploads_ok': sum(ok for ok, _ in uploads),
+            'uploads_failed': sum(not ok for ok, _ in uploads),
+            'upload_seconds_max': round(max(seconds for _, seconds in uploads), 2),
+            'reads': len(latencies),
+            'reads_per_second': round(len(latencies) / elapsed, 1),
+            'read_errors': len(errors),
+            'read_p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            'read_p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            'read_max_ms': round(max(latencies) * 1000, 1) if latencies else None,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv):
+    args = parse_args(argv)
+    data = make_jpeg(args.upload_kb)
+    print(f"{args.uploads} uploads of {len(data) // 1024} KiB at {args.upload_rate} KiB/s, "
+          f"{args.readers} readers, {args.workers} workers")
+    for worker_class in args.worker_classes.split(','):
+        print(json.dumps(run(args, worker_class, data)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
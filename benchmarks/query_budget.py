@@ -0,0 +1,48 @@
+"""
+Fails (exit code 1) if listing or fetching floors issues more SQL queries
+than the budget, or if the count grows with the number of floors.
+
+    python benchmarks/query_budget.py
+"""
+import base64
+import sys
+
+from flask import g
+
+from harness import HEADERS, create_app, seed
+from database import db
+
+QUERY_BUDGET = 4
+FLOOR_COUNTS = [1, 10, 50]
+IMAGE_BASE64 = base64.b64encode(b'\xff\xd8\xff' + b'\0' * 64).decode('ascii')
+
+
+def count_queries(app, path):
+    with app.test_request_context(path, headers=HEADERS):
+        response = app.full_dispatch_request()
+        assert response.status_code == 200, response.status_code
+        return g.get('query_count', 0)
+
+
+def main():
+    failed = False
+    # Query counts at the smallest floor count, which larger ones must match.
+    baseline = {}
+    for floors in FLOOR_COUNTS:
+        app = create_app()
+        seed(app.test_client(), floors, image_base64=IMAGE_BASE64)
+        for path in ('/floor/', '/floor/1', '/floor/?summary=1'):
+            queries = count_queries(app, path)
+            expected = baseline.setdefault(path, queries)
+            ok = queries <= QUERY_BUDGET and queries == expected
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {floors:>3} floors  GET {path:<18} {queries} queries "
+                  f"(budget {QUERY_BUDGET}, expected {expected})")
+        with app.app_context():
+            db.engine.dispose()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Compares the original combine_color_and_texture (fresh arrays, LBP always
+computed, then converted to grayscale) with analysis.Segmenter, which reuses
+its buffers and skips the LBP pass unless texture is requested.
+
+    python benchmarks/segmentation.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+import cv2
+import numpy as np
+from skimage.feature import local_binary_pattern
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from analysis import LOWER_COLOR, UPPER_COLOR, Segmenter  # noqa: E402
+
+SIZES = [(500, 500), (1536, 2048), (3000, 4000)]
+REPEAT = 3
+
+
+def original_segmented_gray(image):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, LOWER_COLOR, UPPER_COLOR)
+    kernel = np.ones((5, 5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = np.where(mask > 0, 255, 0).astype(np.uint8)
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    lbp = local_binary_pattern(gray, 8, 1, method='uniform')
+    lbp_hist, _ = np.histogram(lbp.ravel(), bins=np.arange(0, 11), range=(0, 10))
+
+    segmented = cv2.bitwise_and(image, image, mask=mask)
+    return cv2.cvtColor(segmented, cv2.COLOR_BGR2GRAY)
+
+
+def measure(fn, image):
+    fn(image)
+    seconds = min(timeit.repeat(lambda: fn(image), number=1, repeat=REPEAT))
+    tracemalloc.start()
+    fn(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds * 1000, peak / 1024 / 1024
+
+
+def main():
+    rng = np.random.default_rng(0)
+    segmenter = Segmenter()
+    cases = [
+        ('original', original_segmented_gray),
+        ('segmenter', lambda image: segmenter.run(image)),
+        ('segmenter+texture', lambda image: segmenter.run(image, texture=True)),
+    ]
+    print(f"{'size':>10} {'variant':>18} {'ms':>9} {'peak MiB':>9}")
+    for height, width in SIZES:
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for name, fn in cases:
+            ms, peak = measure(fn, image)
+            print(f"{width}x{height:<5} {name:>18} {ms:9.1f} {peak:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Times serializing the floor list for 1k and 10k floors: the reflective
+Serializer the blueprints used to have against the compiled serializers,
+on ORM objects and on column-only rows, and json against orjson.
+
+    python benchmarks/serialize.py
+"""
+import json
+import time
+
+from flask import url_for
+from sqlalchemy import insert
+
+from harness import create_app
+from blueprints.models import Floor, FloorImage, FloorLinen, LinenType
+from blueprints.serializers import FloorSerializer
+from blueprints.services import FloorService
+from database import db
+from json_provider import OrjsonProvider, orjson
+
+FLOOR_COUNTS = [1000, 10000]
+LINENS_PER_FLOOR = 6
+REPEAT = 3
+
+
+class ReflectiveSerializer():
+    fields = []
+    def serialize(self, item):
+        if item is None:
+            return {}
+
+        serialized_item = {}
+        for field in self.fields:
+            if isinstance(field, tuple):
+                serialized_item[field[1]] = getattr(item, field[0])
+                continue
+            serialized_item[field] = getattr(item, field)
+
+        return serialized_item
+
+    def serializeMany(self, items):
+        return [ self.serialize(item) for item in items ]
+
+class ReflectiveFloorImageSummarySerializer(ReflectiveSerializer):
+    fields = ['id', 'timestamp', 'size', ('mime_type', 'mimeType')]
+
+class ReflectiveLinenSerializer(ReflectiveSerializer):
+    def serialize(self, item):
+        return {'id': item.id, 'type': item.ltype.name, 'quantity': item.quantity}
+
+class ReflectiveFloorSerializer(ReflectiveSerializer):
+    def serialize(self, item):
+        latest_image = ReflectiveFloorImageSummarySerializer().serialize(item.latest_image)
+        if latest_image:
+            latest_image['url'] = url_for('floor.get_floor_image', id=item.id)
+        return {
+            'id': item.id,
+            'name': item.name,
+            'latestImage': latest_image,
+            'hasTrolley': item.has_trolley,
+            'linens': ReflectiveLinenSerializer().serializeMany(item.floor_linen),
+        }
+
+
+def seed_rows(floors):
+    db.session.execute(insert(LinenType), [{'id': i, 'name': f'Linen {i}'} for i in range(1, LINENS_PER_FLOOR + 1)])
+    db.session.execute(insert(FloorImage), [
+        {'id': i, 'floor_id': i, 'sha256': f'{i:064x}', 'size': 1024, 'mime_type': 'image/jpeg'}
+        for i in range(1, floors + 1)
+    ])
+    db.session.execute(insert(Floor), [
+        {'id': i, 'name': f'Floor {i}', 'latest_image_id': i, 'has_trolley': False} for i in range(1, floors + 1)
+    ])
+    db.session.execute(insert(FloorLinen), [
+        {'floor_id': i, 'ltype_id': t, 'quantity': t} for i in range(1, floors + 1) for t in range(1, LINENS_PER_FLOOR + 1)
+    ])
+    db.session.commit()
+
+
+def best_ms(fn, expunge=False):
+    timings = []
+    for _ in range(REPEAT):
+        if expunge:
+            db.session.expunge_all()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    app = create_app()
+    fast_json = OrjsonProvider(app) if orjson else None
+    serializer = FloorSerializer(summary=True)
+
+    print(f"{'floors':>7} {'case':<44} {'ms':>9}")
+    for floors in FLOOR_COUNTS:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed_rows(floors)
+
+        with app.test_request_context():
+            objects = FloorService.get_all_floors()
+            rows = FloorService.get_all_floor_rows()
+            body = serializer.serializeRows(*rows)
+            cases = [
+                ("serialize ORM objects, reflective", lambda: ReflectiveFloorSerializer().serializeMany(objects)),
+                ("serialize ORM objects, compiled", lambda: serializer.serializeMany(objects)),
+                ("serialize rows, compiled", lambda: serializer.serializeRows(*rows)),
+                ("encode json", lambda: json.dumps(body, default=app.json.default)),
+            ]
+            if fast_json:
+                cases.append(("encode orjson", lambda: fast_json.dumps(body)))
+            for name, fn in cases:
+                print(f"{floors:>7} {name:<44} {best_ms(fn):9.1f}")
+
+            end_to_end = [
+                ("query + serialize ORM objects, reflective",
+                 lambda: ReflectiveFloorSerializer().serializeMany(FloorService.get_all_floors())),
+                ("query + serialize rows, compiled",
+                 lambda: serializer.serializeRows(*FloorService.get_all_floor_rows())),
+            ]
+            for name, fn in end_to_end:
+                print(f"{floors:>7} {name:<44} {best_ms(fn, expunge=True):9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Cold-start benchmark: times fresh interpreters from launch to the first
+served request, both in-process (import `app`, then one test-client
+request) and through Gunicorn with and without preloading. Each run is a
+new process against an already migrated throwaway database, so the numbers
+are what a restarted worker or a scaled-out container pays.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --skip-gunicorn
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import API_KEY, SRC_PATH, environment, start_server
+
+HEAVY_MODULES = ['cv2', 'numpy', 'PIL.Image', 'skimage', 'scipy']
+
+IMPORT_SNIPPET = f"""
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get('/floor/', headers={{'X-Api-Key': {API_KEY!r}}})
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5072)
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    return parser.parse_args(argv)
+
+
+def migrate(work_dir):
+    subprocess.run([sys.executable, 'migrations.py'], cwd=SRC_PATH, env=environment(work_dir), check=True)
+
+
+def time_import(work_dir):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET], cwd=SRC_PATH, env=environment(work_dir),
+        check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def time_gunicorn(work_dir, args, preload):
+    started = time.perf_counter()
+    server = start_server(
+        args.port, work_dir, poll_interval=0.01, GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_PRELOAD='1' if preload else '0', MIGRATE_ON_START='0',
+    )
+    try:
+        return {'total_ms': (time.perf_counter() - started) * 1000}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(name, results):
+    summary = {'case': name, 'runs': len(results)}
+    for key in results[0]:
+        if key == 'heavy_modules':
+            summary[key] = results[0][key]
+            continue
+        values = [result[key] for result in results]
+        summary[f'{key}_median'] = round(statistics.median(values), 1)
+        summary[f'{key}_min'] = round(min(values), 1)
+    return summary
+
+
+def main(argv):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='osheet-startup-')
+    try:
+        migrate(work_dir)
+        time_import(work_dir)  # warm the OS page cache and bytecode
+        print(json.dumps(summarize('import + first request', [time_import(work_dir) for _ in range(args.runs)])))
+
+        if not args.skip_gunicorn:
+            for preload in (False, True):
+                results = [time_gunicorn(work_dir, args, preload) for _ in range(args.runs)]
+                name = f"gunicorn {args.workers} workers, preload {'on' if preload else 'off'}"
+                print(json.dumps(summarize(name, results)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,464 @@
+"""
+End-to-end benchmark suite: seeds a throwaway SQLite database with floors,
+linen types and a history of camera-sized cabinet photos, then measures
+
+- the analysis pipeline (decode, crop_and_skew, analyze_sections and the
+  whole analyze_image) on synthetic cabinet images with a known fill,
+- each API route in-process through the Flask test client,
+- a concurrent read/upload mix against a local Gunicorn,
+
+and writes p50/p95/p99 latency, throughput and peak RSS as one JSON
+document, so runs can be kept and compared over time.
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+    python benchmarks/suite.py --floors 200 --images 10 --duration 30 --clients 32
+
+In-process peak RSS is this process' high-water mark, which only grows, so
+sections run from the lightest to the heaviest. Gunicorn's is the largest
+sum of resident memory over the master and its workers, sampled from /proc.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from harness import HEADERS, SRC_PATH, WORK_DIR, create_app, request, start_server
+from analysis import analyze_image, analyze_sections, crop_and_skew, decode_image
+from analysis_defaults import DEFAULT_CORNERS, DEFAULT_GRID, DEFAULT_OUTPUT_SIZE
+
+LINEN_TYPES = ['King', 'Queen', 'Single', 'Towel', 'FaceTowel', 'BathMat', 'Pillowcase', 'Duvet']
+# Default calibration is for the 1536x2048 sample photo in scripts/.
+CALIBRATED_SIZE = (1536, 2048)
+STATUSES = ['empty', 'partial', 'full']
+READ_MIX = [
+    ('GET /floor/?summary=1', 40),
+    ('GET /floor/<id>', 30),
+    ('GET /floor/<id>/images', 10),
+    ('GET /floor/<id>/image', 10),
+    ('GET /inventory/floors', 10),
+]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--floors', type=int, default=50)
+    parser.add_argument('--linen-types', type=int, default=6, choices=range(1, len(LINEN_TYPES) + 1))
+    parser.add_argument('--images', type=int, default=5, help="Historical photos per floor")
+    parser.add_argument('--photo-size', default='1536x2048', help="Photo WIDTHxHEIGHT")
+    parser.add_argument('--photos', type=int, default=8, help="Distinct synthetic photos to draw")
+    parser.add_argument('--analysis-runs', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help="In-process requests per route")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of load against Gunicorn")
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent Gunicorn clients")
+    parser.add_argument('--upload-ratio', type=float, default=0.1, help="Share of Gunicorn requests that upload")
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5073)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-analysis', action='store_true')
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    parser.add_argument('--output', help="Write the results here instead of stdout")
+    parser.add_argument('--compare', help="Earlier results to print latency and throughput changes against")
+    args = parser.parse_args(argv)
+    args.photo_size = tuple(int(v) for v in args.photo_size.lower().split('x'))
+    return args
+
+
+def summarize(latencies, elapsed, errors=0):
+    """
+    Latency percentiles in milliseconds and throughput for one measurement.
+    """
+    summary = {'count': len(latencies), 'errors': errors}
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        summary.update({
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+        })
+    summary['throughput_per_s'] = round(len(latencies) / elapsed, 1) if elapsed else None
+    return summary
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def scaled_corners(photo_size):
+    sx, sy = photo_size[0] / CALIBRATED_SIZE[0], photo_size[1] / CALIBRATED_SIZE[1]
+    return [(round(x * sx), round(y * sy)) for x, y in DEFAULT_CORNERS]
+
+
+class Photos():
+    """
+    Synthetic cabinet photos: a shelf grid drawn in cabinet space with each
+    cell empty, half or fully stacked with white linen, warped into the
+    calibrated quadrilateral of a noisy camera-sized frame and JPEG encoded.
+    """
+    def __init__(self, rng, photo_size, corners):
+        self.rng = rng
+        self.photo_size = photo_size
+        self.corners = corners
+        width, height = photo_size
+        self.noise = rng.integers(0, 24, (height, width, 3), dtype=np.uint8)
+        out_width, out_height = DEFAULT_OUTPUT_SIZE
+        self.matrix = cv2.getPerspectiveTransform(
+            np.float32([(0, 0), (out_width, 0), (out_width, out_height), (0, out_height)]),
+            np.float32(corners),
+        )
+
+    def draw(self):
+        """
+        Returns:
+            (bytes, list): The JPEG and each cell's drawn status.
+        """
+        rows, cols = DEFAULT_GRID
+        out_width, out_height = DEFAULT_OUTPUT_SIZE
+        cell_width, cell_height = out_width // cols, out_height // rows
+        cabinet = np.full((out_height, out_width, 3), (40, 60, 90), np.uint8)
+        statuses = self.rng.choice(STATUSES, rows * cols).tolist()
+        for index, status in enumerate(statuses):
+            if status == 'empty':
+                continue
+            row, col = divmod(index, cols)
+            top = row * cell_height + (cell_height // 2 if status == 'partial' else 2)
+            cv2.rectangle(
+                cabinet, (col * cell_width + 2, top), ((col + 1) * cell_width - 3, (row + 1) * cell_height - 3),
+                (235, 238, 240), cv2.FILLED,
+            )
+
+        width, height = self.photo_size
+        photo = np.full((height, width, 3), (70, 90, 110), np.uint8)
+        cv2.warpPerspective(cabinet, self.matrix, (width, height), dst=photo, borderMode=cv2.BORDER_TRANSPARENT)
+        photo = cv2.add(photo, self.noise)
+        return cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes(), statuses
+
+
+def bench_analysis(args, photos):
+    corners = photos[0][2]
+    stages = {'decode': [], 'crop_and_skew': [], 'analyze_sections': [], 'analyze_image': []}
+    agreement = []
+    for run in range(args.analysis_runs):
+        data, statuses, _ = photos[run % len(photos)]
+        started = time.perf_counter()
+        image = decode_image(data)
+        decoded = time.perf_counter()
+        warped = crop_and_skew(image, corners)
+        warped_at = time.perf_counter()
+        analyze_sections(warped)
+        analyzed = time.perf_counter()
+        sections = analyze_image(data, coords=corners)
+        finished = time.perf_counter()
+
+        stages['decode'].append(decoded - started)
+        stages['crop_and_skew'].append(warped_at - decoded)
+        stages['analyze_sections'].append(analyzed - warped_at)
+        stages['analyze_image'].append(finished - analyzed)
+        agreement.append(np.mean([section['status'] == status for section, status in zip(sections, statuses)]))
+
+    result = {stage: summarize(latencies, sum(latencies)) for stage, latencies in stages.items()}
+    result['status_agreement'] = round(float(np.mean(agreement)), 3)
+    result['peak_rss_mib'] = peak_rss_mib()
+    return result
+
+
+def drain_background_tasks():
+    """
+    Waits for the thumbnails uploads queued on the blocking pool, so they
+    neither run during the next measurement nor outlive the work directory.
+    Each pool thread picks up one barrier task only after its earlier work.
+    """
+    from config import BLOCKING_POOL_WORKERS
+    from pools import blocking_pool
+
+    barrier = threading.Barrier(BLOCKING_POOL_WORKERS + 1)
+    for _ in range(BLOCKING_POOL_WORKERS):
+        blocking_pool.submit(barrier.wait, 300)
+    barrier.wait(300)
+
+
+def database_mib():
+    return round(sum(
+        os.path.getsize(os.path.join(WORK_DIR, name))
+        for name in os.listdir(WORK_DIR) if name.startswith('database.db')
+    ) / 1024 / 1024, 2)
+
+
+def upload_path(floor_id, timestamp):
+    return f'/floor/{floor_id}/image?timestamp={timestamp.isoformat()}'
+
+
+def unique_photo(photos, counter):
+    """
+    A photo whose bytes, and so blob, differ from every other upload, as
+    real photos do: decoders ignore data after the JPEG end marker.
+    """
+    data, _, _ = photos[counter % len(photos)]
+    return data + f'osheet-suite-{counter}'.encode('ascii')
+
+
+def seed(client, args, photos):
+    started = time.perf_counter()
+    for name in LINEN_TYPES[:args.linen_types]:
+        client.post('/linen_type/', headers=HEADERS, json={'name': name})
+    linen_type_ids = list(range(1, args.linen_types + 1))
+    response = client.post('/floor/bulk', headers=HEADERS, json={'floors': [
+        {'name': f'Floor {i}', 'linenTypeIds': linen_type_ids} for i in range(1, args.floors + 1)
+    ]})
+    assert response.status_code == 200, response.json
+
+    now = datetime.utcnow().replace(microsecond=0)
+    uploaded = 0
+    for image in range(args.images):
+        timestamp = now - timedelta(hours=6 * (args.images - image))
+        for floor_id in range(1, args.floors + 1):
+            response = client.put(
+                upload_path(floor_id, timestamp), data=unique_photo(photos, uploaded),
+                headers={**HEADERS, 'Content-Type': 'image/jpeg'},
+            )
+            assert response.status_code == 200, response.json
+            uploaded += 1
+    drain_background_tasks()
+
+    return {
+        'floors': args.floors,
+        'linen_types': args.linen_types,
+        'images': uploaded,
+        'photo_kib': round(np.mean([len(data) for data, _, _ in photos]) / 1024, 1),
+        'seconds': round(time.perf_counter() - started, 2),
+        'database_mib': database_mib(),
+    }
+
+
+def route_path(route, rng, floors):
+    return route.split(' ', 1)[1].replace('<id>', str(rng.randint(1, floors)))
+
+
+def bench_in_process(client, args, photos):
+    rng = random.Random(args.seed)
+    result = {}
+    for route, _ in READ_MIX + [('GET /floor/', 0)]:
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            path = route_path(route, rng, args.floors)
+            request_started = time.perf_counter()
+            response = client.get(path, headers=HEADERS)
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code != 200
+        result[route] = summarize(latencies, time.perf_counter() - started, errors)
+
+    latencies, errors = [], 0
+    timestamp = datetime.utcnow().replace(microsecond=0)
+    started = time.perf_counter()
+    for i in range(args.requests):
+        data = unique_photo(photos, args.floors * args.images + i)
+        request_started = time.perf_counter()
+        response = client.put(
+            upload_path(rng.randint(1, args.floors), timestamp + timedelta(seconds=i)), data=data,
+            headers={**HEADERS, 'Content-Type': 'image/jpeg'},
+        )
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code != 200
+    elapsed = time.perf_counter() - started
+    drain_background_tasks()
+    result['PUT /floor/<id>/image'] = summarize(latencies, elapsed, errors)
+    result['peak_rss_mib'] = peak_rss_mib()
+    return result
+
+
+def process_tree_rss(pid):
+    """
+    Resident bytes of `pid` and all its descendants, from /proc.
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending += children.get(current, [])
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def gunicorn_client(args, photos, index, stop, results):
+    rng = random.Random(args.seed * 1000 + index)
+    routes, weights = zip(*READ_MIX)
+    timestamp = datetime.utcnow().replace(microsecond=0)
+    uploads = 0
+    while not stop.is_set():
+        if rng.random() < args.upload_ratio:
+            route = 'PUT /floor/<id>/image'
+            uploads += 1
+            method, path = 'PUT', upload_path(rng.randint(1, args.floors), timestamp + timedelta(seconds=uploads))
+            body, headers = unique_photo(photos, 10 ** 6 * (index + 1) + uploads), {'Content-Type': 'image/jpeg'}
+        else:
+            route = rng.choices(routes, weights)[0]
+            method, path = 'GET', route_path(route, rng, args.floors)
+            body, headers = None, None
+
+        started = time.perf_counter()
+        try:
+            ok = request(args.port, method, path, body, headers)[0] == 200
+        except OSError:
+            ok = False
+        latencies, errors = results.setdefault(route, ([], [0]))
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors[0] += 1
+
+
+def bench_gunicorn(args, photos):
+    server = start_server(
+        args.port, GUNICORN_WORKER_CLASS=args.worker_class, GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.threads), MIGRATE_ON_START='0',
+    )
+    try:
+        stop = threading.Event()
+        results = [{} for _ in range(args.clients)]
+        clients = [
+            threading.Thread(target=gunicorn_client, args=(args, photos, i, stop, results[i]))
+            for i in range(args.clients)
+        ]
+        peak_rss = process_tree_rss(server.pid)
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        while time.perf_counter() - started < args.duration:
+            time.sleep(0.5)
+            peak_rss = max(peak_rss, process_tree_rss(server.pid))
+        stop.set()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    merged = {}
+    for client_results in results:
+        for route, (latencies, errors) in client_results.items():
+            route_latencies, route_errors = merged.setdefault(route, ([], [0]))
+            route_latencies += latencies
+            route_errors[0] += errors[0]
+
+    result = {
+        'worker_class': args.worker_class,
+        'workers': args.workers,
+        'threads': args.threads,
+        'clients': args.clients,
+        'all': summarize(
+            [latency for latencies, _ in merged.values() for latency in latencies], elapsed,
+            sum(errors[0] for _, errors in merged.values()),
+        ),
+    }
+    for route, (latencies, errors) in sorted(merged.items()):
+        result[route] = summarize(latencies, elapsed, errors[0])
+    result['peak_rss_mib'] = round(peak_rss / 1024 / 1024, 1)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_PATH, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, path=()):
+    """
+    Prints the relative change of every latency percentile and throughput
+    present in both documents.
+    """
+    for key, value in results.items():
+        previous = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(previous, value, path + (key,))
+        elif key.endswith('_ms') or key == 'throughput_per_s':
+            if isinstance(previous, (int, float)) and previous and isinstance(value, (int, float)):
+                print(f"{' / '.join(path + (key,)):<72} {previous:10.2f} -> {value:10.2f} "
+                      f"{(value - previous) / previous * 100:+7.1f}%", file=sys.stderr)
+
+
+def main(argv):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    corners = scaled_corners(args.photo_size)
+    drawer = Photos(rng, args.photo_size, corners)
+    photos = [(*drawer.draw(), corners) for _ in range(args.photos)]
+
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+    }
+    try:
+        if not args.skip_analysis:
+            results['analysis'] = bench_analysis(args, photos)
+
+        from database import db
+
+        app = create_app()
+        client = app.test_client()
+        results['seed'] = seed(client, args, photos)
+        results['in_process'] = bench_in_process(client, args, photos)
+        with app.app_context():
+            db.engine.dispose()
+
+        if not args.skip_gunicorn:
+            results['gunicorn'] = bench_gunicorn(args, photos)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(document + '\n')
+    else:
+        print(document)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(json.load(baseline), results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,529 @@
+"""
+Headless linen fill-level analysis, ported from `scripts/main.py`.
+
+Works on in-memory image bytes: the cabinet region is cropped and
+deskewed, linens are segmented by color, and the region is split into a
+grid of cells whose white-pixel ratio gives a full/partial/empty status.
+
+Uploads are also fingerprinted (a perceptual hash of the cabinet plus the
+mean color of every cell) so near-identical photos can reuse the previous
+analysis, and photos where only a few cells changed re-segment just those.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from analysis_defaults import DEFAULT_CORNERS, DEFAULT_GRID, DEFAULT_OUTPUT_SIZE, DEFAULT_WHITE_THRESHOLD  # noqa: F401
+
+# Off-white color range for linens in HSV.
+LOWER_COLOR = np.array([0, 0, 180], np.uint8)
+UPPER_COLOR = np.array([180, 60, 255], np.uint8)
+
+CLOSE_KERNEL = np.ones((5, 5), np.uint8)
+
+LBP_RADIUS = 1
+LBP_POINTS = 8 * LBP_RADIUS
+
+# Fingerprints are computed on a JPEG decoded at 1/2 scale, which libjpeg
+# does in the DCT domain at a fraction of the cost of a full decode.
+FINGERPRINT_SCALE = 2
+HASH_SAMPLE_SIZE = 32
+HASH_SIZE = 8
+
+# Remap tables take about 6 bytes per output pixel (1.5 MB at 500x500), and
+# every web worker and analysis process keeps its own.
+PERSPECTIVE_CACHE_MAX_BYTES = int(os.environ.get('PERSPECTIVE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+class AnalysisError(Exception):
+    pass
+
+
+# Called as `stage_observer(stage, seconds)` after each pipeline stage when
+# set; the analysis worker points it at its metrics.
+stage_observer = None
+
+
+@contextmanager
+def timed_stage(stage):
+    if stage_observer is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_observer(stage, time.perf_counter() - started)
+
+
+def decode_image(data, flags=cv2.IMREAD_COLOR):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        raise AnalysisError("Image cannot be decoded")
+
+    return image
+
+
+Segmentation = namedtuple('Segmentation', ['gray', 'mask', 'color_image', 'lbp_hist'])
+
+
+class Segmenter():
+    """
+    Color segmentation with optional texture features in one pass over a
+    frame. Intermediate and output arrays are allocated once per frame size
+    and reused, so the arrays returned are only valid until the next call;
+    copy them to keep them. Not thread-safe, see `get_segmenter`.
+    """
+    def __init__(self, lower_color=LOWER_COLOR, upper_color=UPPER_COLOR):
+        self.lower_color = lower_color
+        self.upper_color = upper_color
+        self.shape = None
+
+    def allocate(self, shape):
+        if shape == self.shape:
+            return
+        height, width = shape[:2]
+        self.hsv = np.empty((height, width, 3), np.uint8)
+        self.raw_mask = np.empty((height, width), np.uint8)
+        self.mask = np.empty((height, width), np.uint8)
+        self.gray = np.empty((height, width), np.uint8)
+        self.segmented_gray = np.empty((height, width), np.uint8)
+        self.color_image = np.empty((height, width, 3), np.uint8)
+        self.shape = shape
+
+    def run(self, image, texture=False, color_image=False):
+        """
+        Parameters:
+            image (np.ndarray): BGR image.
+            texture (bool): Also compute the normalized LBP histogram.
+            color_image (bool): Also build the masked BGR image.
+
+        Returns:
+            Segmentation: `gray` is the grayscale image with non-linen pixels
+            zeroed and `mask` the closed 0/255 linen mask; `color_image` and
+            `lbp_hist` are None unless requested.
+        """
+        self.allocate(image.shape)
+
+        cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        cv2.inRange(self.hsv, self.lower_color, self.upper_color, dst=self.raw_mask)
+        # inRange and closing only ever produce 0 or 255, so the mask needs no rebinarizing.
+        cv2.morphologyEx(self.raw_mask, cv2.MORPH_CLOSE, CLOSE_KERNEL, dst=self.mask)
+
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.bitwise_and(self.gray, self.mask, dst=self.segmented_gray)
+
+        masked_image = None
+        if color_image:
+            self.color_image.fill(0)
+            cv2.bitwise_and(image, image, dst=self.color_image, mask=self.mask)
+            masked_image = self.color_image
+
+        lbp_hist = lbp_histogram(self.gray) if texture else None
+
+        return Segmentation(self.segmented_gray, self.mask, masked_image, lbp_hist)
+
+
+_local = threading.local()
+
+
+def get_segmenter(lower_color=LOWER_COLOR, upper_color=UPPER_COLOR):
+    """
+    Returns this thread's Segmenter for the given color bounds, so buffers
+    are reused across frames without being shared between threads.
+    """
+    segmenters = _local.__dict__.setdefault('segmenters', {})
+    key = (tuple(lower_color), tuple(upper_color))
+    segmenter = segmenters.get(key)
+    if segmenter is None:
+        segmenter = segmenters[key] = Segmenter(np.asarray(lower_color, np.uint8), np.asarray(upper_color, np.uint8))
+
+    return segmenter
+
+
+def lbp_histogram(gray):
+    # scikit-image is only needed for texture features, so import it lazily.
+    from skimage.feature import local_binary_pattern
+
+    lbp = local_binary_pattern(gray, LBP_POINTS, LBP_RADIUS, method='uniform')
+
+    lbp_hist, _ = np.histogram(lbp.ravel(), bins=np.arange(0, 11), range=(0, 10))
+    lbp_hist = lbp_hist.astype('float')
+    lbp_hist /= (lbp_hist.sum() + 1e-6)
+
+    return lbp_hist
+
+
+def extract_texture_features(image):
+    return lbp_histogram(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+
+
+def combine_color_and_texture(image, lower_color=LOWER_COLOR, upper_color=UPPER_COLOR):
+    segmentation = Segmenter(lower_color, upper_color).run(image, texture=True, color_image=True)
+
+    return segmentation.color_image, segmentation.lbp_hist
+
+
+def section_status(white_ratio):
+    return 'full' if white_ratio > 0.8 else 'partial' if white_ratio > 0.2 else 'empty'
+
+
+def grid_edges(length, parts):
+    """
+    Splits `length` pixels into `parts` cells whose sizes differ by at most
+    one pixel, so no remainder rows or columns are dropped.
+    """
+    return (np.arange(parts + 1) * length) // parts
+
+
+def section_white_ratios(gray, grid=DEFAULT_GRID, white_threshold=DEFAULT_WHITE_THRESHOLD):
+    """
+    Computes the fraction of pixels above `white_threshold` for every grid cell.
+
+    The image is thresholded once, each band of rows is collapsed to column
+    sums in a single reduction, and the columns are then summed per cell, so
+    the cost barely depends on the grid size.
+
+    Parameters:
+        gray (np.ndarray): Single-channel uint8 image.
+        grid (tuple): Number of (rows, cols) to split the image into.
+        white_threshold (int): Pixel intensity threshold to consider as "white".
+
+    Returns:
+        ratios (np.ndarray): Float array of shape (rows, cols).
+    """
+    height, width = gray.shape[:2]
+    rows, cols = grid
+    ys = grid_edges(height, rows)
+    xs = grid_edges(width, cols)
+
+    _, white = cv2.threshold(gray, white_threshold, 1, cv2.THRESH_BINARY)
+
+    column_counts = np.zeros((rows, width), np.int32)
+    for row in range(rows):
+        if ys[row + 1] > ys[row]:
+            column_counts[row] = cv2.reduce(white[ys[row]:ys[row + 1]], 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+
+    # reduceat needs in-range, increasing starts; empty cells are masked below.
+    starts = np.minimum(xs[:-1], width - 1)
+    counts = np.add.reduceat(column_counts, starts, axis=1)
+    areas = np.outer(np.diff(ys), np.diff(xs))
+
+    return np.divide(counts, areas, out=np.zeros(areas.shape), where=areas > 0)
+
+
+def analyze_sections(image, grid=DEFAULT_GRID, white_threshold=DEFAULT_WHITE_THRESHOLD,
+                     lower_color=LOWER_COLOR, upper_color=UPPER_COLOR):
+    """
+    Divides an image into a grid and calculates the percentage of white pixels per section.
+
+    Parameters:
+        image (np.ndarray): The skewed/cropped image.
+        grid (tuple): Number of (rows, cols) to split the image into.
+        white_threshold (int): Pixel intensity threshold to consider as "white".
+        lower_color, upper_color: HSV bounds of linen colors.
+
+    Returns:
+        section_data (list of dicts): Each dict has position, white pixel ratio and status.
+    """
+    with timed_stage('segment'):
+        segmentation = get_segmenter(lower_color, upper_color).run(image)
+    with timed_stage('section_stats'):
+        ratios = section_white_ratios(segmentation.gray, grid, white_threshold)
+
+    return [
+        {
+            'row': row,
+            'col': col,
+            'white_ratio': white_ratio,
+            'status': section_status(white_ratio),
+        }
+        for row, row_ratios in enumerate(ratios.tolist())
+        for col, white_ratio in enumerate(row_ratios)
+    ]
+
+
+def analyze_cells(image, cells, grid=DEFAULT_GRID, white_threshold=DEFAULT_WHITE_THRESHOLD,
+                  lower_color=LOWER_COLOR, upper_color=UPPER_COLOR):
+    """
+    Computes the white-pixel ratio of only some grid cells. Each cell is
+    segmented with a margin wide enough for the closing to see the same
+    neighbourhood, so the ratios equal those of `analyze_sections`.
+
+    Parameters:
+        image (np.ndarray): The skewed/cropped image.
+        cells (list): Row-major cell indexes to analyze.
+        grid, white_threshold, lower_color, upper_color: See `analyze_sections`.
+
+    Returns:
+        ratios (dict): White pixel ratio by cell index.
+    """
+    height, width = image.shape[:2]
+    rows, cols = grid
+    ys = grid_edges(height, rows)
+    xs = grid_edges(width, cols)
+    # Closing dilates then erodes, each reaching half the kernel further.
+    margin = CLOSE_KERNEL.shape[0] - 1
+    # Crops differ in size, so they get their own buffers rather than
+    # reallocating the thread's full-frame Segmenter.
+    segmenter = Segmenter(np.asarray(lower_color, np.uint8), np.asarray(upper_color, np.uint8))
+
+    ratios = {}
+    for index in cells:
+        row, col = divmod(index, cols)
+        y0, y1, x0, x1 = ys[row], ys[row + 1], xs[col], xs[col + 1]
+        if y1 <= y0 or x1 <= x0:
+            ratios[index] = 0.0
+            continue
+        top, left = max(y0 - margin, 0), max(x0 - margin, 0)
+        crop = np.ascontiguousarray(image[top:min(y1 + margin, height), left:min(x1 + margin, width)])
+        cell = segmenter.run(crop).gray[y0 - top:y1 - top, x0 - left:x1 - left]
+        ratios[index] = np.count_nonzero(cell > white_threshold) / cell.size
+
+    return ratios
+
+
+def assign_linen_types(sections, linen_types):
+    """
+    Assigns linen types to sections based on a predefined list of linen types.
+
+    Parameters:
+        sections (list of dicts): The section data with white pixel ratios.
+        linen_types (list): List of linen types in order, should match the grid's size.
+
+    Returns:
+        sections_with_types (list): Updated section data with linen types assigned.
+    """
+    if len(sections) != len(linen_types):
+        raise ValueError("Number of linen types must match the number of sections.")
+
+    for i, section in enumerate(sections):
+        section['linen_type'] = linen_types[i]
+
+    return sections
+
+
+class PerspectiveMapCache():
+    """
+    Remap tables by (coords, output_size), evicting the least recently used
+    once their total size exceeds `max_bytes`.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, coords, output_size):
+        key = (coords, output_size)
+        with self.lock:
+            maps = self.entries.get(key)
+            if maps is not None:
+                self.entries.move_to_end(key)
+                return maps
+
+        maps = compute_perspective_maps(coords, output_size)
+        nbytes = sum(m.nbytes for m in maps)
+        if nbytes > self.max_bytes:
+            return maps
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = maps
+                self.size += nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sum(m.nbytes for m in evicted)
+        return maps
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+perspective_map_cache = PerspectiveMapCache(PERSPECTIVE_CACHE_MAX_BYTES)
+
+
+def perspective_maps(coords, output_size):
+    """
+    Remap tables for warping `coords` onto `output_size`, cached by
+    calibration so a floor whose camera has not been recalibrated never
+    recomputes its homography. The cache is bounded by
+    PERSPECTIVE_CACHE_MAX_BYTES.
+    """
+    return perspective_map_cache.get(coords, output_size)
+
+
+def compute_perspective_maps(coords, output_size):
+    """
+    Precomputes the remap tables for warping the quadrilateral `coords` onto
+    an `output_size` rectangle.
+
+    Parameters:
+        coords (tuple): Four (x, y) tuples, see `crop_and_skew`.
+        output_size (tuple): Size of the output image (width, height).
+
+    Returns:
+        (np.ndarray, np.ndarray): Fixed-point maps for `cv2.remap`.
+    """
+    pts_src = np.array(coords, dtype="float32")
+    width, height = output_size
+
+    pts_dst = np.array([
+        [0, 0],
+        [width - 1, 0],
+        [width - 1, height - 1],
+        [0, height - 1]
+    ], dtype="float32")
+
+    # Map every output pixel back through the inverse homography.
+    M_inv = np.linalg.inv(cv2.getPerspectiveTransform(pts_src, pts_dst))
+    xs, ys = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    w = M_inv[2, 0] * xs + M_inv[2, 1] * ys + M_inv[2, 2]
+    map_x = ((M_inv[0, 0] * xs + M_inv[0, 1] * ys + M_inv[0, 2]) / w).astype(np.float32)
+    map_y = ((M_inv[1, 0] * xs + M_inv[1, 1] * ys + M_inv[1, 2]) / w).astype(np.float32)
+
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+def crop_and_skew(image, coords, output_size=DEFAULT_OUTPUT_SIZE):
+    """
+    Crops and applies a perspective transform to the specified region of an image.
+
+    Parameters:
+        image (np.ndarray): The decoded input image.
+        coords (list): List of four (x, y) tuples for the corners in the order:
+                       top-left, top-right, bottom-right, bottom-left.
+        output_size (tuple): Size of the output image (width, height).
+
+    Returns:
+        warped (np.ndarray): The transformed (cropped + skewed) image.
+    """
+    map1, map2 = perspective_maps(
+        tuple(tuple(float(v) for v in point) for point in coords),
+        tuple(int(v) for v in output_size),
+    )
+
+    return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+
+def analyze_image(data, coords=DEFAULT_CORNERS, output_size=DEFAULT_OUTPUT_SIZE, grid=DEFAULT_GRID,
+                  linen_types=None, white_threshold=DEFAULT_WHITE_THRESHOLD,
+                  lower_color=LOWER_COLOR, upper_color=UPPER_COLOR, cells=None, base_sections=None):
+    """
+    Runs the whole pipeline on encoded image bytes. Given `cells` and
+    `base_sections`, only those cells are analyzed and the others are
+    copied from `base_sections`.
+
+    Parameters:
+        data (bytes): The encoded (JPEG/PNG/WebP) image.
+        coords (list): Cabinet corners, see `crop_and_skew`.
+        output_size (tuple): Size of the deskewed cabinet (width, height).
+        grid (tuple): Number of (rows, cols) in the cabinet.
+        linen_types (list): Linen type per cell in row-major order, or None.
+        white_threshold (int): Pixel intensity threshold to consider as "white".
+        lower_color, upper_color: HSV bounds of linen colors.
+        cells (list): Row-major indexes of the cells to analyze, or None for all.
+        base_sections (list of dicts): Previous sections for the other cells.
+
+    Returns:
+        sections (list of dicts): Per-cell row, col, white_ratio, status and linen_type.
+    """
+    with timed_stage('decode'):
+        image = decode_image(data)
+    with timed_stage('warp'):
+        warped = crop_and_skew(image, coords, output_size)
+    if cells is None or base_sections is None:
+        sections = analyze_sections(warped, grid, white_threshold, lower_color, upper_color)
+    else:
+        with timed_stage('segment'):
+            ratios = analyze_cells(warped, cells, grid, white_threshold, lower_color, upper_color)
+        sections = [dict(section) for section in base_sections]
+        for index, white_ratio in ratios.items():
+            sections[index]['white_ratio'] = white_ratio
+            sections[index]['status'] = section_status(white_ratio)
+    if linen_types is None:
+        linen_types = [None] * len(sections)
+
+    return assign_linen_types(sections, linen_types)
+
+
+
+Fingerprint = namedtuple('Fingerprint', ['phash', 'cells'])
+
+
+def perceptual_hash(gray):
+    """
+    64-bit DCT hash of a grayscale image as 16 hex digits. Recompression,
+    noise and small shifts flip few bits; a changed scene flips many.
+    """
+    sample = cv2.resize(gray, (HASH_SAMPLE_SIZE, HASH_SAMPLE_SIZE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(sample.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term only tracks overall brightness, so it is left out of the median.
+    bits = low > np.median(low[1:])
+
+    return np.packbits(bits).tobytes().hex()
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def cell_means(image, grid=DEFAULT_GRID):
+    """
+    Mean B, G, R of every grid cell, read off one integral image.
+
+    Returns:
+        means (np.ndarray): Float array of shape (rows, cols, 3).
+    """
+    height, width = image.shape[:2]
+    ys = grid_edges(height, grid[0])
+    xs = grid_edges(width, grid[1])
+
+    corners = cv2.integral(image)[ys][:, xs].astype(np.int64)
+    sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+    areas = np.outer(np.diff(ys), np.diff(xs))[..., None]
+
+    return np.divide(sums, areas, out=np.zeros(sums.shape), where=areas > 0)
+
+
+def fingerprint_image(data, coords=DEFAULT_CORNERS, output_size=DEFAULT_OUTPUT_SIZE, grid=DEFAULT_GRID):
+    """
+    Fingerprints the cabinet region of encoded image bytes, at half scale.
+
+    Parameters:
+        data (bytes): The encoded (JPEG/PNG/WebP) image.
+        coords, output_size, grid: Calibration, see `analyze_image`.
+
+    Returns:
+        Fingerprint: `phash` from `perceptual_hash` and `cells`, the
+        row-major mean color per cell as nested lists.
+    """
+    image = decode_image(data, cv2.IMREAD_REDUCED_COLOR_2)
+    coords = [(x / FINGERPRINT_SCALE, y / FINGERPRINT_SCALE) for x, y in coords]
+    output_size = tuple(max(v // FINGERPRINT_SCALE, 1) for v in output_size)
+    warped = crop_and_skew(image, coords, output_size)
+
+    return Fingerprint(
+        perceptual_hash(cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)),
+        np.round(cell_means(warped, grid), 1).tolist(),
+    )
+
+
+def changed_cells(previous, current, tolerance):
+    """
+    Row-major indexes of the cells whose mean color moved by more than
+    `tolerance` on any channel, or None if the grids differ.
+    """
+    previous = np.asarray(previous)
+    current = np.asarray(current)
+    if previous.shape != current.shape:
+        return None
+
+    return np.flatnonzero(np.abs(current - previous).max(axis=-1).ravel() > tolerance).tolist()
@@ -0,0 +1,11 @@
+"""
+Analysis defaults the web process needs for planning jobs and validating
+calibrations, kept apart from `analysis` so importing them does not load
+OpenCV and NumPy.
+"""
+
+# Sample calibration from scripts/main.py, used until a floor is calibrated.
+DEFAULT_CORNERS = [(316, 494), (999, 526), (945, 1505), (315, 1512)]
+DEFAULT_OUTPUT_SIZE = (500, 500)
+DEFAULT_GRID = (10, 10)
+DEFAULT_WHITE_THRESHOLD = 200
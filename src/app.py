@@ -1,32 +1,65 @@
+"""
+Flask application factory. `create_app()` only wires up extensions, hooks
+and blueprints; it never touches the database, so importing it is cheap and
+safe to do once in a preloading Gunicorn master. Create or upgrade the
+schema with `python migrations.py` (Gunicorn does it once in its master on
+start, see gunicorn.conf.py).
+"""
+import logging
+
 from flask import Flask
+from flask_cors import CORS
+
 from blueprints.floor import app as FloorBlueprint
 from blueprints.linen_type import app as LinenTypeBlueprint
-from database import db
-from middleware import check_api_key
-from config import DEBUG
-from flask_cors import CORS
+from blueprints.event import app as EventBlueprint
+from blueprints.inventory import app as InventoryBlueprint
+from database import init_database
+from middleware import check_api_key, add_query_count_header, dump_profile, start_profile
+from metrics import init_metrics
+from compression import compress_response
+from config import DATABASE_URI, DEBUG, FAST_JSON, MAX_REQUEST_BYTES, PROFILE_ENABLED
+from json_provider import init_json
+
 
-app = Flask(__name__)
-CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.sort_keys = False
+def create_app(database_uri=DATABASE_URI):
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+    CORS(app)
+    init_json(app, FAST_JSON)
+    if __name__ != '__main__':
+        gunicorn_logger = logging.getLogger('gunicorn.error')
+        app.logger.handlers = gunicorn_logger.handlers
+        app.logger.setLevel(gunicorn_logger.level)
+    init_metrics(app)
+    app.before_request(check_api_key)
+    app.after_request(compress_response)
+    if DEBUG:
+        app.after_request(add_query_count_header)
+    if PROFILE_ENABLED:
+        app.before_request(start_profile)
+        app.after_request(dump_profile)
+    init_database(app, database_uri)
+    app.register_blueprint(FloorBlueprint)
+    app.register_blueprint(LinenTypeBlueprint)
+    app.register_blueprint(EventBlueprint)
+    app.register_blueprint(InventoryBlueprint)
 
-if __name__ != '__main__':
-    import logging
-    gunicorn_logger = logging.getLogger('gunicorn.error')
-    app.logger.handlers = gunicorn_logger.handlers
-    app.logger.setLevel(gunicorn_logger.level)
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Create missing tables and run pending data migrations."""
+        from migrations import migrate
 
-app.before_request(check_api_key)
+        migrate()
 
-db.init_app(app)
+    return app
 
-with app.app_context():
-    db.create_all()
 
-app.register_blueprint(FloorBlueprint)
-app.register_blueprint(LinenTypeBlueprint)
+app = create_app()
 
 if __name__ == '__main__':
+    from migrations import migrate
+
+    with app.app_context():
+        migrate()
     app.run(host='0.0.0.0', port=5001, debug=DEBUG)
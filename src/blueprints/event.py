@@ -0,0 +1,60 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from config import EVENTS_BACKLOG_LIMIT, EVENTS_KEEPALIVE
+from database import db
+from events import event_bus
+from .services import EventService
+from .serializers import FloorEventSerializer
+
+app = Blueprint('event', __name__, url_prefix='/events')
+
+def format_event(event):
+    return f"id: {event['id']}\ndata: {current_app.json.dumps(event)}\n\n"
+
+def read_events(after_id):
+    try:
+        return FloorEventSerializer().serializeMany(EventService.since(after_id, EVENTS_BACKLOG_LIMIT))
+    finally:
+        db.session.remove()
+
+@app.route('', methods=['GET'])
+def stream_events():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    def generate():
+        latest_id = event_bus.subscribe(current_app._get_current_object())
+        after_id = latest_id if last_event_id is None else last_event_id
+        try:
+            yield "retry: 3000\n\n"
+            # Resuming clients first catch up from the table, which holds more
+            # than the in-memory buffer.
+            while last_event_id is not None:
+                backlog = read_events(after_id)
+                for event in backlog:
+                    yield format_event(event)
+                    after_id = event['id']
+                if len(backlog) < EVENTS_BACKLOG_LIMIT:
+                    break
+
+            while True:
+                events = event_bus.wait(after_id, EVENTS_KEEPALIVE)
+                if events is None:
+                    events = read_events(after_id)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield format_event(event)
+                    after_id = event['id']
+        finally:
+            event_bus.unsubscribe()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,10 +1,28 @@
-from flask import request, jsonify, Blueprint
+import io
+from datetime import datetime
 
-from .services import FloorService
-from .serializers import FloorSerializer
+from flask import request, jsonify, Blueprint, send_file, url_for
+
+from cache import conditional_json_response
+from config import ALLOWED_IMAGE_TYPES, MAX_IMAGE_UPLOAD_BYTES
+from storage import BlobTooLarge, EmptyBlob, blob_store, decode_base64_image
+from variants import VARIANTS, VariantError, derivative_cache
+from analysis_defaults import DEFAULT_GRID, DEFAULT_OUTPUT_SIZE
+from .inventory import parse_timestamp
+from .services import (
+    AnalysisJobService, CalibrationService, FloorNotFound, FloorService, ImageHistoryService, LinenAlreadyOnFloor,
+    LinenTypeService, VersionService, FLOORS_VERSION,
+)
+from .serializers import AnalysisJobSerializer, FloorCalibrationSerializer, FloorImageSummarySerializer, FloorSerializer
 
 app = Blueprint('floor', __name__, url_prefix='/floor')
 
+def is_summary():
+    return request.args.get('summary', '').lower() in ("1", "true", "yes", "on")
+
+def versioned_etag(resource_version, summary):
+    return f"{resource_version.key}-{resource_version.version}-{'summary' if summary else 'full'}"
+
 @app.route('/', methods=['POST'])
 def create_new_floor():
     data = request.get_json()
@@ -16,20 +34,132 @@ def create_new_floor():
     FloorService.create(name)
     return jsonify({'message': 'Floor created successfully'}), 200
 
+def is_int_list(value):
+    return isinstance(value, list) and all(isinstance(v, int) and not isinstance(v, bool) for v in value)
+
+@app.route('/bulk', methods=['POST'])
+def create_floors():
+    floors = (request.get_json() or {}).get('floors')
+    if not isinstance(floors, list) or not floors:
+        return jsonify({'error': 'Missing floors'}), 400
+
+    parsed = []
+    for floor in floors:
+        if not isinstance(floor, dict) or not floor.get('name'):
+            return jsonify({'error': 'Missing floor name'}), 400
+        linen_type_ids = floor.get('linenTypeIds', [])
+        if not is_int_list(linen_type_ids):
+            return jsonify({'error': 'linenTypeIds must be a list of ids'}), 400
+        parsed.append({
+            'name': floor['name'],
+            'has_trolley': bool(floor.get('hasTrolley', False)),
+            'linen_type_ids': linen_type_ids,
+        })
+
+    try:
+        created = FloorService.create_many(parsed)
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+    return jsonify({'message': 'Floors created successfully', 'ids': [floor.id for floor in created]}), 200
+
 @app.route('/', methods=['GET'])
 def get_all_floors():
-    floors = FloorService.get_all_floors()
-    return jsonify(FloorSerializer().serializeMany(floors)), 200
+    summary = is_summary()
+    resource_version = VersionService.get(FLOORS_VERSION)
+    return conditional_json_response(
+        versioned_etag(resource_version, summary),
+        resource_version.updated_at,
+        lambda: FloorSerializer(summary=summary).serializeRows(*FloorService.get_all_floor_rows()),
+    )
 
-@app.route('/<id>', methods=['GET'])
+@app.route('/<int:id>', methods=['GET'])
 def get_floor(id):
+    summary = is_summary()
+    try:
+        resource_version = VersionService.get_floor(id)
+        return conditional_json_response(
+            versioned_etag(resource_version, summary),
+            resource_version.updated_at,
+            lambda: FloorSerializer(summary=summary).serialize(FloorService.get(id)),
+        )
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+@app.route('/<int:id>/image', methods=['GET'])
+def get_floor_image(id):
+    try:
+        floor_image = FloorService.get_latest_image(id)
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    return send_image(floor_image)
+
+@app.route('/<int:id>/images', methods=['GET'])
+def get_floor_images(id):
+    try:
+        start = parse_timestamp(request.args['from']) if request.args.get('from') else None
+        end = parse_timestamp(request.args['to']) if request.args.get('to') else None
+        limit = min(int(request.args.get('limit', 50)), 500)
+        before = None
+        if request.args.get('cursor'):
+            timestamp, _, image_id = request.args['cursor'].rpartition('_')
+            before = (datetime.fromisoformat(timestamp), int(image_id))
+    except ValueError:
+        return jsonify({'error': 'from, to and cursor must be ISO timestamps, limit an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    try:
+        images, next_cursor = ImageHistoryService.history(id, start, end, limit, before)
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    serialized = FloorImageSummarySerializer().serializeMany(images)
+    for item in serialized:
+        item['url'] = url_for('floor.get_floor_history_image', id=id, image_id=item['id'])
+
+    next_url = None
+    if next_cursor:
+        args = {**request.args, 'cursor': f'{next_cursor[0].isoformat()}_{next_cursor[1]}'}
+        next_url = url_for('floor.get_floor_images', id=id, **args)
+
+    return jsonify({'images': serialized, 'next': next_url}), 200
+
+@app.route('/<int:id>/images/<int:image_id>', methods=['GET'])
+def get_floor_history_image(id, image_id):
     try:
-        floor = FloorService.get(id)
-        return jsonify(FloorSerializer().serialize(floor)), 200
+        floor_image = ImageHistoryService.get(id, image_id)
     except Exception as e:
         return jsonify({"error": e.args[0]}), 404
 
-@app.route('/<id>', methods=["DELETE"])
+    return send_image(floor_image)
+
+def send_image(floor_image):
+    size = request.args.get('size')
+    if not size or size == 'original':
+        return send_file(
+            blob_store.path(floor_image.sha256),
+            mimetype=floor_image.mime_type,
+            etag=floor_image.sha256,
+            conditional=True,
+        )
+
+    if size not in VARIANTS:
+        return jsonify({'error': f'Unknown size, expected one of original, {", ".join(VARIANTS)}'}), 400
+
+    try:
+        path = derivative_cache.get(floor_image.sha256, size)
+    except VariantError as e:
+        return jsonify({"error": e.args[0]}), 422
+
+    return send_file(
+        path,
+        mimetype=derivative_cache.mime_type(size),
+        etag=f'{floor_image.sha256}-{size}',
+        conditional=True,
+    )
+
+@app.route('/<int:id>', methods=["DELETE"])
 def delete_floor(id):
     if not id:
         return jsonify({'error': 'Missing id'}), 400
@@ -37,7 +167,7 @@ def delete_floor(id):
     return jsonify({'message': 'Floor deleted successfully'}), 200
 
 
-@app.route('/<id>/update_image', methods=['POST'])
+@app.route('/<int:id>/update_image', methods=['POST'])
 def update_image(id):
     data = request.get_json()
     timestamp = data.get('timestamp')
@@ -47,12 +177,115 @@ def update_image(id):
         return jsonify({'error': 'Missing floor or image_base64 or timestamp'}), 400
 
     try:
-        FloorService.update_image(id, image_base64, timestamp)
-        return jsonify({'message': 'Image uploaded successfully'}), 200
+        image, mime_type = decode_base64_image(image_base64)
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 400
+
+    return store_image(id, io.BytesIO(image), timestamp, mime_type)
+
+@app.route('/<int:id>/image', methods=['PUT'])
+def put_image(id):
+    if request.content_length is not None and request.content_length > MAX_IMAGE_UPLOAD_BYTES:
+        return jsonify({'error': f'Image exceeds {MAX_IMAGE_UPLOAD_BYTES} bytes'}), 413
+
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if not upload:
+            return jsonify({'error': 'Missing image'}), 400
+        mime_type = upload.mimetype if upload.mimetype in ALLOWED_IMAGE_TYPES else None
+        return store_image(id, upload.stream, request.form.get('timestamp'), mime_type)
+
+    if request.mimetype not in ALLOWED_IMAGE_TYPES:
+        return jsonify({'error': f'Unsupported Content-Type, expected one of {", ".join(ALLOWED_IMAGE_TYPES)} or multipart/form-data'}), 415
+    if request.content_length == 0:
+        return jsonify({'error': 'Missing image'}), 400
+
+    return store_image(id, request.stream, request.args.get('timestamp'), request.mimetype)
+
+def store_image(id, stream, timestamp, mime_type):
+    # Parsed before the body is streamed to the blob store.
+    try:
+        timestamp = parse_timestamp(timestamp) if timestamp else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timestamp must be an ISO timestamp'}), 400
+
+    try:
+        floor_image, job, analysis = FloorService.update_image(id, stream, timestamp, mime_type)
+        return jsonify({
+            'message': 'Image uploaded successfully',
+            'imageId': floor_image.id,
+            'jobId': job.id if job else None,
+            'analysis': analysis,
+            'changedCells': job.cells if job else None,
+        }), 200
+    except BlobTooLarge as e:
+        return jsonify({"error": e.args[0]}), 413
+    except EmptyBlob as e:
+        return jsonify({"error": e.args[0]}), 400
+    except FloorNotFound as e:
+        return jsonify({"error": e.args[0]}), 404
+
+@app.route('/<int:id>/analysis', methods=['GET'])
+def get_floor_analysis(id):
+    try:
+        job = AnalysisJobService.latest(id)
+        return jsonify(AnalysisJobSerializer().serialize(job)), 200
     except Exception as e:
         return jsonify({"error": e.args[0]}), 404
 
-@app.route('/<id>/add_linen', methods=['POST'])
+def parse_pair(value, name, minimum=1):
+    if not isinstance(value, list) or len(value) != 2 \
+            or not all(isinstance(v, int) and not isinstance(v, bool) and v >= minimum for v in value):
+        raise ValueError(f'{name} must be two integers >= {minimum}')
+    return value
+
+def parse_calibration(data):
+    corners = data.get('corners')
+    if not isinstance(corners, list) or len(corners) != 4 or not all(
+            isinstance(point, list) and len(point) == 2
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0 for v in point)
+            for point in corners):
+        raise ValueError('corners must be four [x, y] points: top-left, top-right, bottom-right, bottom-left')
+
+    output_size = parse_pair(data.get('outputSize', list(DEFAULT_OUTPUT_SIZE)), 'outputSize')
+    grid = parse_pair(data.get('grid', list(DEFAULT_GRID)), 'grid')
+    if grid[0] > output_size[1] or grid[1] > output_size[0]:
+        raise ValueError('grid cannot have more cells than outputSize has pixels')
+
+    layout = data.get('layout')
+    if layout is not None and (not isinstance(layout, list) or len(layout) != grid[0] * grid[1] or not all(
+            ltype_id is None or (isinstance(ltype_id, int) and not isinstance(ltype_id, bool)) for ltype_id in layout)):
+        raise ValueError('layout must list a linen_type_id or null for each of the rows * cols cells')
+
+    return corners, output_size, grid, layout
+
+@app.route('/<int:id>/calibration', methods=['GET'])
+def get_calibration(id):
+    try:
+        calibration = CalibrationService.get(id)
+        return jsonify(FloorCalibrationSerializer().serialize(calibration)), 200
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+@app.route('/<int:id>/calibration', methods=['PUT'])
+def update_calibration(id):
+    try:
+        corners, output_size, grid, layout = parse_calibration(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": e.args[0]}), 400
+
+    try:
+        LinenTypeService.require(ltype_id for ltype_id in layout or () if ltype_id is not None)
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 400
+
+    try:
+        calibration = CalibrationService.update(id, corners, output_size, grid, layout)
+        return jsonify(FloorCalibrationSerializer().serialize(calibration)), 200
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+@app.route('/<int:id>/add_linen', methods=['POST'])
 def add_linen(id):
     data = request.get_json()
     linen_type_id = data.get('linen_type_id')
@@ -63,10 +296,41 @@ def add_linen(id):
     try:
         FloorService.add_linen(id, linen_type_id=linen_type_id)
         return jsonify({'message': 'Linen Type added to floor successfully'}), 200
+    except LinenAlreadyOnFloor as e:
+        return jsonify({"error": e.args[0]}), 409
+    except Exception as e:
+        return jsonify({"error": e.args[0]}), 404
+
+@app.route('/<int:id>/linens', methods=['POST'])
+def update_linens(id):
+    data = request.get_json() or {}
+    add = data.get('add', [])
+    remove = data.get('remove', [])
+    quantities = data.get('set', [])
+
+    if not is_int_list(add) or not is_int_list(remove):
+        return jsonify({'error': 'add and remove must be lists of ids'}), 400
+    if not isinstance(quantities, list) or not all(
+            isinstance(item, dict) and is_int_list([item.get('id'), item.get('quantity')]) and item['quantity'] >= 0
+            for item in quantities):
+        return jsonify({'error': 'set must be a list of {id, quantity}'}), 400
+    if not add and not remove and not quantities:
+        return jsonify({'error': 'Missing add, remove or set'}), 400
+
+    try:
+        added = FloorService.update_linens(
+            id, add=add, remove=remove, quantities={item['id']: item['quantity'] for item in quantities},
+        )
+        return jsonify({
+            'message': 'Floor Linens updated successfully',
+            'added': [floor_linen.id for floor_linen in added],
+        }), 200
+    except LinenAlreadyOnFloor as e:
+        return jsonify({"error": e.args[0]}), 409
     except Exception as e:
         return jsonify({"error": e.args[0]}), 404
 
-@app.route('/<id>/remove_linen', methods=['POST'])
+@app.route('/<int:id>/remove_linen', methods=['POST'])
 def remove_linen(id):
     data = request.get_json()
     floor_linen_id = data.get('floor_linen_id')
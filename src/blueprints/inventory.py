@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, jsonify, request
+
+from cache import conditional_json_response
+from config import FILL_LEVEL_MAX_POINTS
+from .services import (
+    FILL_LEVELS_VERSION, FLOORS_VERSION, LINEN_TYPES_VERSION, FillLevelService, InventoryService, VersionService,
+)
+from .serializers import (
+    FillLevelSeriesSerializer, FloorInventorySerializer, LinenTypeInventorySerializer, LowFloorSerializer,
+)
+
+app = Blueprint('inventory', __name__, url_prefix='/inventory')
+
+DEFAULT_SPANS = {'5m': timedelta(days=1), 'hour': timedelta(days=7), 'day': timedelta(days=90)}
+
+def parse_timestamp(value):
+    """
+    Parses an ISO timestamp into the naive UTC datetimes the models store.
+    """
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def inventory_response(name, build):
+    """
+    Inventory totals change with floor linens and linen types, so their
+    ETag combines both versions.
+    """
+    floors_version = VersionService.get(FLOORS_VERSION)
+    linen_types_version = VersionService.get(LINEN_TYPES_VERSION)
+    last_modified = max(
+        (version.updated_at for version in (floors_version, linen_types_version) if version.updated_at),
+        default=None,
+    )
+    return conditional_json_response(
+        f"inventory-{name}-{floors_version.version}-{linen_types_version.version}", last_modified, build,
+    )
+
+@app.route('/linen_types', methods=['GET'])
+def get_linen_type_totals():
+    return inventory_response(
+        'linen_types', lambda: LinenTypeInventorySerializer().serializeRows(InventoryService.linen_type_totals()),
+    )
+
+@app.route('/floors', methods=['GET'])
+def get_floor_totals():
+    return inventory_response(
+        'floors', lambda: FloorInventorySerializer().serializeRows(InventoryService.floor_totals()),
+    )
+
+@app.route('/floors/low', methods=['GET'])
+def get_low_floors():
+    threshold = request.args.get('threshold', type=int)
+    linen_type_id = request.args.get('linenTypeId', type=int)
+    if threshold is None:
+        return jsonify({'error': 'threshold must be an integer'}), 400
+    if 'linenTypeId' in request.args and linen_type_id is None:
+        return jsonify({'error': 'linenTypeId must be an integer'}), 400
+
+    return inventory_response(
+        f"low-{threshold}-{linen_type_id}",
+        lambda: LowFloorSerializer().serializeRows(InventoryService.floors_below(threshold, linen_type_id)),
+    )
+
+@app.route('/fill_levels', methods=['GET'])
+def get_fill_levels():
+    resolution = request.args.get('resolution', 'day')
+    if resolution not in FillLevelService.RESOLUTIONS:
+        return jsonify({'error': f"resolution must be one of {', '.join(FillLevelService.RESOLUTIONS)}"}), 400
+    step = FillLevelService.RESOLUTIONS[resolution]
+    try:
+        # The default window ends with the current bucket, so repeated
+        # requests share an ETag until a new bucket starts.
+        end = parse_timestamp(request.args['to']) if request.args.get('to') \
+            else FillLevelService.EPOCH + timedelta(seconds=FillLevelService.bucket(datetime.utcnow(), resolution) + step)
+        start = parse_timestamp(request.args['from']) if request.args.get('from') \
+            else end - DEFAULT_SPANS[resolution]
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO timestamps'}), 400
+    floor_id = request.args.get('floorId', type=int)
+    linen_type_id = request.args.get('linenTypeId', type=int)
+    if ('floorId' in request.args and floor_id is None) or ('linenTypeId' in request.args and linen_type_id is None):
+        return jsonify({'error': 'floorId and linenTypeId must be integers'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    buckets = range(FillLevelService.bucket(start, resolution), FillLevelService.seconds(end), step)
+    if len(buckets) > FILL_LEVEL_MAX_POINTS:
+        return jsonify({'error': f'at most {FILL_LEVEL_MAX_POINTS} points per series, use a coarser resolution'}), 400
+
+    version = VersionService.get(FILL_LEVELS_VERSION)
+    return conditional_json_response(
+        f"fill-levels-{version.version}-{resolution}-{start.isoformat()}-{end.isoformat()}-{floor_id}-{linen_type_id}",
+        version.updated_at,
+        lambda: {
+            'resolution': resolution,
+            'from': start,
+            'to': end,
+            'buckets': [FillLevelService.EPOCH + timedelta(seconds=bucket) for bucket in buckets],
+            'series': FillLevelSeriesSerializer().serializeRows(
+                FillLevelService.series(resolution, start, end, floor_id, linen_type_id), buckets,
+            ),
+        },
+    )
@@ -1,6 +1,7 @@
 from flask import request, jsonify, Blueprint
 
-from .services import LinenTypeService
+from cache import conditional_json_response
+from .services import LinenTypeService, VersionService, LINEN_TYPES_VERSION
 from .serializers import LinenTypeSerializer
 
 app = Blueprint('linen_type', __name__, url_prefix='/linen_type')
@@ -18,8 +19,12 @@ def create_new_linen_type():
 
 @app.route('/', methods=['GET'])
 def get_all_floors():
-    floors = LinenTypeService.get_all_linen_types()
-    return jsonify(LinenTypeSerializer().serializeMany(floors)), 200
+    resource_version = VersionService.get(LINEN_TYPES_VERSION)
+    return conditional_json_response(
+        f"{resource_version.key}-{resource_version.version}",
+        resource_version.updated_at,
+        lambda: LinenTypeSerializer().serializeMany(LinenTypeService.get_all_linen_types()),
+    )
 
 @app.route('/<id>', methods=['GET'])
 def get_floor(id):
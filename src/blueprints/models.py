@@ -1,6 +1,8 @@
+import base64
 from datetime import datetime
 from sqlalchemy.orm import backref
 from database import db
+from storage import blob_store
 
 
 class LinenType(db.Model):
@@ -9,8 +11,23 @@ class LinenType(db.Model):
 
 class FloorImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    image = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    floor_id = db.Column(db.Integer, db.ForeignKey('floor.id', use_alter=True))
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(50), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_floor_image_floor_id_timestamp', 'floor_id', 'timestamp'),
+    )
+
+    @property
+    def image(self):
+        return FloorImage.encode(self.sha256)
+
+    @staticmethod
+    def encode(sha256):
+        return base64.b64encode(blob_store.read(sha256)).decode('ascii')
 
 class Floor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,7 +35,7 @@ class Floor(db.Model):
     latest_image_id = db.Column(db.Integer, db.ForeignKey(FloorImage.id))
     has_trolley = db.Column(db.Boolean, default=False)
 
-    latest_image = db.relationship("FloorImage", backref=backref("floor", uselist=True))
+    latest_image = db.relationship("FloorImage", foreign_keys=[latest_image_id], backref=backref("floor", uselist=True))
 
 class FloorLinen(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -28,3 +45,149 @@ class FloorLinen(db.Model):
 
     floor = db.relationship("Floor", backref=backref("floor_linen", uselist=True))
     ltype = db.relationship("LinenType", backref=backref("floor_linen", uselist=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('floor_id', 'ltype_id', name='uq_floor_linen_floor_id_ltype_id'),
+        db.Index('ix_floor_linen_ltype_id_quantity', 'ltype_id', 'quantity'),
+    )
+
+class LinenTypeInventory(db.Model):
+    """
+    Hotel-wide total of one linen type and the number of floors stocking
+    it, kept in step with FloorLinen by InventoryService.
+    """
+    ltype_id = db.Column(db.Integer, db.ForeignKey(LinenType.id), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    floors = db.Column(db.Integer, nullable=False, default=0)
+
+class FloorInventory(db.Model):
+    """
+    Total linens on one floor and the number of linen types it stocks,
+    kept in step with FloorLinen by InventoryService.
+    """
+    floor_id = db.Column(db.Integer, db.ForeignKey(Floor.id), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0, index=True)
+    linen_types = db.Column(db.Integer, nullable=False, default=0)
+
+class FloorCalibration(db.Model):
+    floor_id = db.Column(db.Integer, db.ForeignKey(Floor.id), primary_key=True)
+    corners = db.Column(db.JSON, nullable=False)
+    output_width = db.Column(db.Integer, nullable=False)
+    output_height = db.Column(db.Integer, nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    cols = db.Column(db.Integer, nullable=False)
+    layout = db.Column(db.JSON)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    floor = db.relationship("Floor", backref=backref("calibration", uselist=False))
+
+class ImageAnalysis(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey(FloorImage.id), nullable=False, unique=True)
+    sections = db.Column(db.JSON, nullable=False)
+    analyzed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    image = db.relationship("FloorImage", backref=backref("analysis", uselist=False))
+
+class ImageFingerprint(db.Model):
+    """
+    Upload-time fingerprint of an image's cabinet region, comparable only
+    between images fingerprinted with the same `geometry` (calibration).
+    """
+    image_id = db.Column(db.Integer, db.ForeignKey(FloorImage.id), primary_key=True)
+    geometry = db.Column(db.String(40), nullable=False)
+    phash = db.Column(db.String(16), nullable=False)
+    cells = db.Column(db.JSON, nullable=False)
+
+    image = db.relationship("FloorImage", backref=backref("fingerprint", uselist=False))
+
+class AnalysisJob(db.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+
+    id = db.Column(db.Integer, primary_key=True)
+    floor_id = db.Column(db.Integer, db.ForeignKey(Floor.id), nullable=False, index=True)
+    image_id = db.Column(db.Integer, db.ForeignKey(FloorImage.id), nullable=False)
+    # Partial jobs only analyze `cells` and copy the rest from base_image.
+    base_image_id = db.Column(db.Integer, db.ForeignKey(FloorImage.id))
+    cells = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    floor = db.relationship("Floor")
+    image = db.relationship("FloorImage", foreign_keys=[image_id])
+    base_image = db.relationship("FloorImage", foreign_keys=[base_image_id])
+
+    __table_args__ = (
+        db.Index('ix_analysis_job_status_available_at', 'status', 'available_at'),
+    )
+
+class FillLevelSample(db.Model):
+    """
+    Append-only fill levels: one row per analyzed image and linen type.
+    `image_id` is not a foreign key, so samples outlive compacted images.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    floor_id = db.Column(db.Integer, nullable=False)
+    ltype_id = db.Column(db.Integer, nullable=False)
+    image_id = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    cells = db.Column(db.Integer, nullable=False)
+    fill = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_fill_level_sample_floor_id_timestamp', 'floor_id', 'timestamp'),
+    )
+
+class FillLevelRollup(db.Model):
+    """
+    FillLevelSample aggregated per floor, linen type and 5 minute, hour or
+    day bucket, updated as samples are appended. `bucket` is the bucket's
+    start in Unix seconds.
+    """
+    resolution = db.Column(db.String(8), primary_key=True)
+    floor_id = db.Column(db.Integer, primary_key=True)
+    ltype_id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    samples = db.Column(db.Integer, nullable=False)
+    quantity_sum = db.Column(db.Integer, nullable=False)
+    quantity_min = db.Column(db.Integer, nullable=False)
+    quantity_max = db.Column(db.Integer, nullable=False)
+    fill_sum = db.Column(db.Float, nullable=False)
+
+    # Clustered on the primary key, so a chart reads its buckets in order
+    # from adjacent pages instead of looking each row up.
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class ResourceVersion(db.Model):
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class FloorEvent(db.Model):
+    """
+    Append-only log of floor changes. The autoincrement id is the event
+    sequence that every worker process polls and SSE clients resume from.
+    """
+    CREATED = 'created'
+    DELETED = 'deleted'
+    IMAGE = 'image'
+    LINENS = 'linens'
+    ANALYSIS = 'analysis'
+
+    id = db.Column(db.Integer, primary_key=True)
+    floor_id = db.Column(db.Integer, nullable=False)
+    change = db.Column(db.String(20), nullable=False)
+    version = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Ids must never be reused after pruning, or resuming clients would skip events.
+    __table_args__ = {'sqlite_autoincrement': True}
@@ -1,43 +1,213 @@
+from itertools import groupby
+from operator import itemgetter
+
+from flask import url_for
+
+from .models import FloorImage
+
+URL_ID_PLACEHOLDER = 987654321
+
+
+def compile_fields(fields, columns=None):
+    """
+    Generates a function that builds the dict for `fields` with plain
+    attribute access, e.g. `lambda item: {'id': item.id, 'type': item.ltype.name}`.
+    Given the `columns` of a result row, fields are read by position
+    instead (`item[0]`), which is much cheaper than a Row's named access.
+    """
+    entries = []
+    for field in fields:
+        attr, key = field if isinstance(field, tuple) else (field, field)
+        if not all(part.isidentifier() for part in attr.split('.')):
+            raise ValueError(f"Invalid serializer field {attr!r}")
+        if columns is None:
+            entries.append(f"{key!r}: item.{attr}")
+        else:
+            entries.append(f"{key!r}: item[{list(columns).index(attr)}]")
+
+    namespace = {}
+    exec(f"def serialize(item):\n    return {{{', '.join(entries)}}}", namespace)
+    return namespace['serialize']
+
 class Serializer():
+    """
+    Maps attributes to JSON keys. A field is an attribute name, or an
+    (attribute, key) tuple; dotted attributes follow relationships.
+
+    The field list is compiled once per class into a function doing plain
+    attribute lookups into a dict literal, so nothing is inspected per item.
+    `serializeRows` does the same for the Row tuples of column-only selects
+    whose labels match the attribute names, compiled once per column order.
+    """
     fields = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.serialize_fields = staticmethod(compile_fields(cls.fields))
+        cls.row_serializers = {}
+
+    @classmethod
+    def row_serializer(cls, columns):
+        serialize = cls.row_serializers.get(columns)
+        if serialize is None:
+            serialize = cls.row_serializers[columns] = compile_fields(cls.fields, columns)
+        return serialize
+
     def serialize(self, item):
         if item is None:
             return {}
 
-        serialized_item = {}
-        for field in self.fields:
-            if isinstance(field, tuple):
-                serialized_item[field[1]] = getattr(item, field[0])
-                continue
-            serialized_item[field] = getattr(item, field)
-
-        return serialized_item
+        return self.serialize_fields(item)
 
     def serializeMany(self, items):
-        return [ self.serialize(item) for item in items ]
+        if type(self).serialize is Serializer.serialize:
+            serialize = self.serialize_fields
+        else:
+            serialize = self.serialize
+        return [ serialize(item) for item in items ]
+
+    def serializeRows(self, rows):
+        if not rows:
+            return []
+
+        serialize = self.row_serializer(rows[0]._fields)
+        return [ serialize(row) for row in rows ]
 
 class FloorImageSerializer(Serializer):
     fields = ['id', 'image', 'timestamp']
 
+class FloorImageSummarySerializer(Serializer):
+    fields = ['id', 'timestamp', 'size', ('mime_type', 'mimeType')]
+
 class LinenTypeSerializer(Serializer):
     fields = ['id', 'name']
 
 class LinenSerializer(Serializer):
-    def serialize(self, item):
-        return {
-            'id': item.id,
-            'type': item.ltype.name,
-            'quantity': item.quantity
-        }
+    fields = ['id', ('ltype.name', 'type'), 'quantity']
+
+class LinenRowSerializer(Serializer):
+    fields = ['id', 'type', 'quantity']
+
+class LinenTypeInventorySerializer(Serializer):
+    fields = ['id', 'name', 'quantity', 'floors']
+
+class FloorInventorySerializer(Serializer):
+    fields = ['id', 'name', 'quantity', ('linen_types', 'linenTypes')]
+
+class LowFloorSerializer(Serializer):
+    fields = ['id', 'name', 'quantity']
+
+class FillLevelSeriesSerializer():
+    """
+    Groups rollup rows, ordered by floor, linen type and bucket, into one
+    columnar series per floor and linen type: `quantity` (mean), `min`,
+    `max` and `fill` (mean) lists aligned with the shared `buckets` axis,
+    None where a bucket has no samples. A 90 day chart of 100 floors is
+    then a few hundred lists of numbers instead of tens of thousands of
+    objects repeating keys and timestamps.
+    """
+    def serializeRows(self, rows, buckets):
+        positions = { bucket: i for i, bucket in enumerate(buckets) }
+        series = []
+        for (floor_id, ltype_id), points in groupby(rows, key=itemgetter(0, 1)):
+            columns = [ [None] * len(buckets) for _ in range(4) ]
+            quantity, minimum, maximum, fill = columns
+            for _, _, bucket, *values in points:
+                i = positions[bucket]
+                quantity[i], minimum[i], maximum[i], fill[i] = values
+            series.append({
+                'floorId': floor_id,
+                'linenTypeId': ltype_id,
+                'quantity': quantity,
+                'min': minimum,
+                'max': maximum,
+                'fill': fill,
+            })
+        return series
 
 class FloorSerializer(Serializer):
+    image_serializer = FloorImageSerializer()
+    image_summary_serializer = FloorImageSummarySerializer()
+    linen_serializer = LinenSerializer()
+    linen_row_serializer = LinenRowSerializer()
+
+    def __init__(self, summary=False):
+        self.summary = summary
+
+    def serialize_latest_image(self, item):
+        if not self.summary:
+            return self.image_serializer.serialize(item.latest_image)
+
+        latest_image = self.image_summary_serializer.serialize(item.latest_image)
+        if latest_image:
+            latest_image['url'] = url_for('floor.get_floor_image', id=item.id)
+        return latest_image
+
     def serialize(self, item):
-        latest_image = FloorImageSerializer().serialize(item.latest_image)
-        linens = LinenSerializer().serializeMany(item.floor_linen)
         return {
             'id': item.id,
             'name': item.name,
-            'latestImage': latest_image,
+            'latestImage': self.serialize_latest_image(item),
             'hasTrolley': item.has_trolley,
-            'linens': linens,
+            'linens': self.linen_serializer.serializeMany(item.floor_linen),
+        }
+
+    def serializeRows(self, rows, linens=()):
+        """
+        Serializes the column-only rows of FloorService.get_all_floor_rows
+        without building ORM objects. `linens` must be ordered by floor.
+        """
+        serialize_linen = self.linen_row_serializer.row_serializer(linens[0]._fields) if linens else None
+        linens_by_floor = {
+            floor_id: [serialize_linen(linen) for linen in group]
+            for floor_id, group in groupby(linens, key=itemgetter(0))
         }
+        # One url_for per call rather than per floor; the route takes an int
+        # id, so a placeholder number stands in for it.
+        url_prefix, _, url_suffix = url_for('floor.get_floor_image', id=URL_ID_PLACEHOLDER) \
+            .rpartition(str(URL_ID_PLACEHOLDER))
+
+        serialized = []
+        for id, name, has_trolley, image_id, sha256, size, mime_type, timestamp in rows:
+            if image_id is None:
+                latest_image = {}
+            elif self.summary:
+                latest_image = {
+                    'id': image_id,
+                    'timestamp': timestamp,
+                    'size': size,
+                    'mimeType': mime_type,
+                    'url': f"{url_prefix}{id}{url_suffix}",
+                }
+            else:
+                latest_image = {'id': image_id, 'image': FloorImage.encode(sha256), 'timestamp': timestamp}
+            serialized.append({
+                'id': id,
+                'name': name,
+                'latestImage': latest_image,
+                'hasTrolley': has_trolley,
+                'linens': linens_by_floor.get(id, []),
+            })
+        return serialized
+
+class AnalysisJobSerializer(Serializer):
+    fields = ['id', 'status', ('image_id', 'imageId'), ('base_image_id', 'baseImageId'), 'cells', 'attempts', 'error', ('created_at', 'createdAt'), ('updated_at', 'updatedAt')]
+
+    def serialize(self, item):
+        serialized_item = super().serialize(item)
+        analysis = item.image.analysis if item.status == 'done' else None
+        serialized_item['sections'] = analysis.sections if analysis else None
+        return serialized_item
+
+class FloorCalibrationSerializer(Serializer):
+    def serialize(self, item):
+        return {
+            'corners': item.corners,
+            'outputSize': [item.output_width, item.output_height],
+            'grid': [item.rows, item.cols],
+            'layout': item.layout,
+            'updatedAt': item.updated_at,
+        }
+
+class FloorEventSerializer(Serializer):
+    fields = ['id', ('floor_id', 'floorId'), 'change', 'version', ('created_at', 'timestamp')]
@@ -1,76 +1,902 @@
+import hashlib
+import json
 from database import db
-from datetime import datetime
-from .models import Floor, FloorImage, FloorLinen, LinenType
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, case, insert, literal, or_, and_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from analysis_defaults import DEFAULT_CORNERS, DEFAULT_GRID, DEFAULT_OUTPUT_SIZE
+from config import (
+    ANALYSIS_ENABLED, ANALYSIS_MAX_ATTEMPTS, ANALYSIS_RETRY_DELAY, CHANGE_CELL_TOLERANCE, CHANGE_DETECTION_ENABLED,
+    CHANGE_HASH_DISTANCE, CHANGE_PARTIAL_MAX_RATIO, MAX_IMAGE_UPLOAD_BYTES, RETENTION_HOURLY_DAYS,
+    RETENTION_KEEP_ALL_DAYS,
+)
+from pools import run_blocking, run_in_background
+from storage import blob_store, sniff_mime_type
+from variants import derivative_cache
+from .models import (
+    AnalysisJob, FillLevelRollup, FillLevelSample, Floor, FloorCalibration, FloorEvent, FloorImage, FloorInventory,
+    FloorLinen, ImageAnalysis, ImageFingerprint, LinenType, LinenTypeInventory, ResourceVersion,
+)
+
+FLOORS_VERSION = 'floors'
+LINEN_TYPES_VERSION = 'linen_types'
+FILL_LEVELS_VERSION = 'fill_levels'
+
+def floor_version_key(id):
+    # Canonical, so '01' and 1 share a version.
+    return f'floor:{int(id)}'
+
+class LinenAlreadyOnFloor(Exception):
+    pass
+
+class FloorNotFound(Exception):
+    pass
+
+class VersionService():
+    @staticmethod
+    def get(key):
+        return db.session.get(ResourceVersion, key) or ResourceVersion(key=key, version=0)
+
+    @staticmethod
+    def get_floor(id):
+        """
+        Reads a floor's version in the same query that checks the floor
+        exists, so a missing floor is never answered 304 for a guessed or
+        stale ETag.
+        """
+        key = floor_version_key(id)
+        row = db.session.query(Floor.id, ResourceVersion).outerjoin(ResourceVersion, ResourceVersion.key == key) \
+            .filter(Floor.id == id).first()
+        if row is None:
+            raise Exception("Floor not found")
+        return row[1] or ResourceVersion(key=key, version=0)
+
+    @staticmethod
+    def bump(*keys):
+        """
+        Advances the given versions in the current transaction: one UPDATE,
+        plus an INSERT the first time a key is seen.
+        """
+        keys = set(keys)
+        now = datetime.utcnow().replace(microsecond=0)
+        updated = ResourceVersion.query.filter(ResourceVersion.key.in_(keys)).update(
+            {'version': ResourceVersion.version + 1, 'updated_at': now}, synchronize_session=False
+        )
+        if updated == len(keys):
+            return
+
+        existing = {row.key for row in db.session.query(ResourceVersion.key).filter(ResourceVersion.key.in_(keys))}
+        db.session.add_all([ResourceVersion(key=key, version=1, updated_at=now) for key in keys - existing])
+
+class EventService():
+    @staticmethod
+    def record(change, *floor_ids):
+        """
+        Appends one FloorEvent per floor, carrying the floor's version after
+        this transaction's bump. Call it after VersionService.bump; the
+        events become visible when the caller commits.
+        """
+        if not floor_ids:
+            return
+
+        db.session.flush()
+        db.session.execute(
+            insert(FloorEvent).values(
+                floor_id=bindparam('floor_id'),
+                change=change,
+                version=select(ResourceVersion.version)
+                    .where(ResourceVersion.key == bindparam('key'))
+                    .scalar_subquery(),
+                created_at=datetime.utcnow(),
+            ),
+            [{'floor_id': floor_id, 'key': floor_version_key(floor_id)} for floor_id in set(floor_ids)],
+        )
+
+    @staticmethod
+    def latest_id():
+        return db.session.query(db.func.max(FloorEvent.id)).scalar() or 0
+
+    @staticmethod
+    def since(after_id, limit=1000):
+        return FloorEvent.query.filter(FloorEvent.id > after_id).order_by(FloorEvent.id).limit(limit).all()
+
+    @staticmethod
+    def prune(before):
+        deleted = FloorEvent.query.filter(FloorEvent.created_at < before).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
 
 class FloorService():
+    @staticmethod
+    def query_with_relations():
+        return Floor.query.options(
+            joinedload(Floor.latest_image),
+            selectinload(Floor.floor_linen).joinedload(FloorLinen.ltype),
+        )
+
     @staticmethod
     def create(name):
         floor = Floor()
         floor.name = name
         db.session.add(floor)
+        db.session.flush()
+        InventoryService.add_floors(floor.id)
+        VersionService.bump(FLOORS_VERSION, floor_version_key(floor.id))
+        EventService.record(FloorEvent.CREATED, floor.id)
         db.session.commit()
 
     @staticmethod
     def get_all_floors():
-        return Floor.query.all();
+        return FloorService.query_with_relations().all();
+
+    @staticmethod
+    def get_all_floor_rows():
+        """
+        Reads every floor for the list endpoint as plain column tuples: one
+        query for the floors with their latest image, one for all linens
+        ordered by floor. Skips building ORM objects and identity-map upkeep.
+        FloorSerializer.serializeRows unpacks these columns in this order.
+        """
+        floors = db.session.execute(
+            select(
+                Floor.id, Floor.name, Floor.has_trolley, Floor.latest_image_id,
+                FloorImage.sha256, FloorImage.size, FloorImage.mime_type, FloorImage.timestamp,
+            )
+            .outerjoin(FloorImage, Floor.latest_image_id == FloorImage.id)
+            .order_by(Floor.id)
+        ).all()
+        linens = db.session.execute(
+            select(FloorLinen.floor_id, FloorLinen.id, LinenType.name.label('type'), FloorLinen.quantity)
+            .join(LinenType, FloorLinen.ltype_id == LinenType.id)
+            .order_by(FloorLinen.floor_id, FloorLinen.id)
+        ).all()
+        return floors, linens
 
     @staticmethod
     def get(id):
-        floor = Floor.query.filter_by(id=id).first()
+        floor = FloorService.query_with_relations().filter_by(id=id).first()
         if not floor:
             raise Exception("Floor not found")
 
         return floor
 
     @staticmethod
-    def update_image(id, image, timestamp):
+    def get_latest_image(id):
+        floor = FloorService.get(id)
+        if not floor.latest_image:
+            raise Exception("Floor has no image")
+
+        return floor.latest_image
+
+    @staticmethod
+    def update_image(id, stream, timestamp=None, mime_type=None):
+        """
+        Stores an upload, taken at the naive UTC `timestamp` (default now),
+        as the floor's latest image. With analysis enabled it is first
+        compared with the previous image, see ChangeDetectionService.compare:
+        an unchanged photo reuses the previous blob and analysis, and one
+        with a few changed cells queues a partial analysis job.
+
+        Returns:
+            (FloorImage, AnalysisJob, str): The image, the queued job or None,
+            and the change detection outcome (None with analysis disabled).
+        """
+        if not db.session.query(Floor.id).filter_by(id=id).first():
+            raise FloorNotFound("Floor not found")
+        # Release the pooled connection while a slow client uploads.
+        db.session.commit()
+
+        sha256, size = blob_store.put_stream(stream, max_bytes=MAX_IMAGE_UPLOAD_BYTES, allow_empty=False)
+        fingerprint = None
+        if ANALYSIS_ENABLED and CHANGE_DETECTION_ENABLED:
+            fingerprint = ChangeDetectionService.fingerprint(id, sha256)
         floor = Floor.query.filter_by(id=id).first()
         if not floor:
-            raise Exception("Floor not found")
+            raise FloorNotFound("Floor not found")
+        outcome, base_image, cells, fingerprint = ChangeDetectionService.compare(floor, sha256, fingerprint) \
+            if ANALYSIS_ENABLED else (None, None, None, None)
+
         floor_image = FloorImage()
-        floor_image.image = image
-        floor_image.timestamp = datetime.fromisoformat(timestamp)
+        floor_image.floor_id = floor.id
+        if outcome == ChangeDetectionService.DEDUPLICATED:
+            floor_image.sha256 = base_image.sha256
+            floor_image.size = base_image.size
+            floor_image.mime_type = base_image.mime_type
+        else:
+            floor_image.sha256 = sha256
+            floor_image.size = size
+            floor_image.mime_type = mime_type or sniff_mime_type(blob_store.head(sha256))
+        floor_image.timestamp = timestamp or datetime.utcnow()
         db.session.add(floor_image)
-        db.session.commit()
+        db.session.flush()
+        if fingerprint:
+            db.session.add(ImageFingerprint(image_id=floor_image.id, **fingerprint))
         floor.latest_image_id = floor_image.id
+
+        job = None
+        if outcome == ChangeDetectionService.DEDUPLICATED:
+            ChangeDetectionService.reuse_analysis(floor, floor_image, base_image)
+        elif outcome == ChangeDetectionService.PARTIAL:
+            job = AnalysisJobService.enqueue(floor.id, floor_image.id, base_image.id, cells)
+        elif outcome == ChangeDetectionService.FULL:
+            job = AnalysisJobService.enqueue(floor.id, floor_image.id)
+        VersionService.bump(FLOORS_VERSION, floor_version_key(floor.id))
+        EventService.record(FloorEvent.IMAGE, floor.id)
         db.session.commit()
 
-        return floor
+        if floor_image.sha256 != sha256:
+            # The upload duplicated the previous image; keep only its blob.
+            if not db.session.query(FloorImage.id).filter_by(sha256=sha256).first():
+                blob_store.delete(sha256)
+        else:
+            # Thumbnails are rendered off the request thread; a request that
+            # arrives first renders its size on demand.
+            run_in_background(derivative_cache.generate_all, sha256, description=f"variants for image {floor_image.id}")
+
+        return floor_image, job, outcome
 
     @staticmethod
     def delete(id):
+        """
+        Deletes a floor with its calibration, images, analyses and jobs, so a
+        floor that later reuses the id starts empty, then removes blobs no
+        other image references.
+        """
+        image_ids = [image_id for (image_id,) in db.session.query(FloorImage.id).filter_by(floor_id=id)]
+        InventoryService.remove_floor(id)
+        FillLevelService.remove_floor(id)
+        # The floor and its images reference each other.
+        Floor.query.filter_by(id=id).update({'latest_image_id': None}, synchronize_session=False)
+        AnalysisJob.query.filter_by(floor_id=id).delete(synchronize_session=False)
+        digests = RetentionService.remove_images(image_ids)
+        FloorCalibration.query.filter_by(floor_id=id).delete(synchronize_session=False)
         Floor.query.filter_by(id=id).delete()
+        VersionService.bump(FLOORS_VERSION, floor_version_key(id))
+        EventService.record(FloorEvent.DELETED, id)
         db.session.commit()
 
+        RetentionService.delete_unused_blobs(digests)
+
     @staticmethod
     def add_linen(id, linen_type_id):
-        floor = Floor.query.filter_by(id=id).first()
-        if not floor:
+        # Inserts only if both the floor and the linen type exist, without a
+        # separate SELECT; only a failed insert looks up which one is missing.
+        try:
+            inserted = db.session.execute(
+                insert(FloorLinen).from_select(
+                    ['ltype_id', 'floor_id', 'quantity'],
+                    select(LinenType.id, Floor.id, literal(0))
+                        .join(LinenType, LinenType.id == linen_type_id).where(Floor.id == id),
+                )
+            ).rowcount
+        except IntegrityError:
+            db.session.rollback()
+            raise LinenAlreadyOnFloor("Linen Type is already on floor")
+        if not inserted:
+            db.session.rollback()
+            LinenTypeService.require([linen_type_id])
             raise Exception("Floor not found")
-        floor_linen = FloorLinen()
-        floor_linen.ltype_id = linen_type_id;
-        floor_linen.floor_id = id;
-        floor_linen.quantity = 0;
-        db.session.add(floor_linen)
+        InventoryService.adjust([(id, linen_type_id, 0, 1)])
+        VersionService.bump(FLOORS_VERSION, floor_version_key(id))
+        EventService.record(FloorEvent.LINENS, id)
         db.session.commit()
 
     @staticmethod
     def remove_linen(id, floor_linen_id):
-        floor = Floor.query.filter_by(id=id).first()
-        if not floor:
-            raise Exception("Floor not found")
-        floor_linen = FloorLinen.query.filter_by(id=floor_linen_id).first()
+        floor_linen = FloorLinen.query.filter_by(id=floor_linen_id, floor_id=id).first()
         if not floor_linen:
+            db.session.rollback()
             raise Exception("Floor Linen not found")
         db.session.delete(floor_linen)
+        InventoryService.adjust([(id, floor_linen.ltype_id, -(floor_linen.quantity or 0), -1)])
+        VersionService.bump(FLOORS_VERSION, floor_version_key(id))
+        EventService.record(FloorEvent.LINENS, id)
+        db.session.commit()
+
+    @staticmethod
+    def update_linens(id, add=(), remove=(), quantities=None):
+        """
+        Adds linen types, removes FloorLinens and sets quantities for one
+        floor in a single transaction.
+
+        Parameters:
+            add (list): LinenType ids to add, each with quantity 0.
+            remove (list): FloorLinen ids to remove.
+            quantities (dict): FloorLinen id to new quantity.
+
+        Returns:
+            list: The added FloorLinens.
+        """
+        quantities = quantities or {}
+        if not db.session.query(Floor.id).filter_by(id=id).first():
+            raise Exception("Floor not found")
+        LinenTypeService.require(add)
+
+        changes = []
+        try:
+            if remove:
+                removed = db.session.query(FloorLinen.ltype_id, FloorLinen.quantity) \
+                    .filter(FloorLinen.floor_id == id, FloorLinen.id.in_(set(remove))).all()
+                if len(removed) != len(set(remove)):
+                    raise Exception("Floor Linen not found")
+                FloorLinen.query.filter(FloorLinen.floor_id == id, FloorLinen.id.in_(set(remove))) \
+                    .delete(synchronize_session=False)
+                changes += [(id, ltype_id, -(quantity or 0), -1) for ltype_id, quantity in removed]
+
+            if quantities:
+                floor_linens = FloorLinen.query.filter(FloorLinen.floor_id == id, FloorLinen.id.in_(quantities.keys())).all()
+                if len(floor_linens) != len(quantities):
+                    raise Exception("Floor Linen not found")
+                for floor_linen in floor_linens:
+                    changes.append((id, floor_linen.ltype_id, quantities[floor_linen.id] - (floor_linen.quantity or 0), 0))
+                    floor_linen.quantity = quantities[floor_linen.id]
+
+            added = [FloorLinen(ltype_id=linen_type_id, floor_id=id, quantity=0) for linen_type_id in dict.fromkeys(add)]
+            db.session.add_all(added)
+            changes += [(id, floor_linen.ltype_id, 0, 1) for floor_linen in added]
+            InventoryService.adjust(changes)
+            VersionService.bump(FLOORS_VERSION, floor_version_key(id))
+            EventService.record(FloorEvent.LINENS, id)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise LinenAlreadyOnFloor("Linen Type is already on floor")
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return added
+
+    @staticmethod
+    def create_many(floors):
+        """
+        Creates floors with their linens in a single transaction.
+
+        Parameters:
+            floors (list of dicts): Each has `name`, optional `has_trolley`
+                and optional `linen_type_ids`.
+
+        Returns:
+            list: The created Floors.
+        """
+        LinenTypeService.require(
+            linen_type_id for floor in floors for linen_type_id in floor.get('linen_type_ids', [])
+        )
+        created = [Floor(name=floor['name'], has_trolley=floor.get('has_trolley', False)) for floor in floors]
+        db.session.add_all(created)
+        db.session.flush()
+        floor_linens = [
+            FloorLinen(ltype_id=linen_type_id, floor_id=floor.id, quantity=0)
+            for floor, data in zip(created, floors)
+            for linen_type_id in dict.fromkeys(data.get('linen_type_ids', []))
+        ]
+        db.session.add_all(floor_linens)
+        InventoryService.add_floors(*[floor.id for floor in created])
+        InventoryService.adjust([(floor_linen.floor_id, floor_linen.ltype_id, 0, 1) for floor_linen in floor_linens])
+        VersionService.bump(FLOORS_VERSION, *[floor_version_key(floor.id) for floor in created])
+        EventService.record(FloorEvent.CREATED, *[floor.id for floor in created])
+        db.session.commit()
+
+        return created
+
+class ImageHistoryService():
+    @staticmethod
+    def get(id, image_id):
+        floor_image = FloorImage.query.filter_by(id=image_id, floor_id=id).first()
+        if not floor_image:
+            raise Exception("Image not found")
+
+        return floor_image
+
+    @staticmethod
+    def history(id, start=None, end=None, limit=50, before=None):
+        """
+        A page of a floor's images, newest first, read from the
+        (floor_id, timestamp) index.
+
+        Parameters:
+            start, end (datetime): Optional inclusive time range.
+            limit (int): Page size.
+            before (tuple): (timestamp, id) of the last image of the previous page.
+
+        Returns:
+            (list, tuple): The images and the cursor for the next page, or None.
+        """
+        if not db.session.query(Floor.id).filter_by(id=id).first():
+            raise Exception("Floor not found")
+
+        query = FloorImage.query.filter(FloorImage.floor_id == id)
+        if start:
+            query = query.filter(FloorImage.timestamp >= start)
+        if end:
+            query = query.filter(FloorImage.timestamp <= end)
+        if before:
+            timestamp, image_id = before
+            query = query.filter(or_(
+                FloorImage.timestamp < timestamp,
+                and_(FloorImage.timestamp == timestamp, FloorImage.id < image_id),
+            ))
+        images = query.order_by(FloorImage.timestamp.desc(), FloorImage.id.desc()).limit(limit + 1).all()
+
+        if len(images) <= limit:
+            return images, None
+        images = images[:limit]
+        return images, (images[-1].timestamp, images[-1].id)
+
+class RetentionService():
+    @staticmethod
+    def bucket(timestamp, now, keep_all_days=RETENTION_KEEP_ALL_DAYS, hourly_days=RETENTION_HOURLY_DAYS):
+        """
+        The retention bucket of an image: None if it is kept unconditionally,
+        otherwise the hour or day of which only one image is kept.
+        """
+        age = now - timestamp
+        if age < timedelta(days=keep_all_days):
+            return None
+        if age < timedelta(days=hourly_days):
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def prunable(floor_id, now, page_size=1000):
+        """
+        Yields ids of a floor's images that the retention policy drops. The
+        newest image of each hour or day bucket and the floor's latest image
+        are kept.
+        """
+        latest_image_id = db.session.query(Floor.latest_image_id).filter_by(id=floor_id).scalar()
+        cutoff = now - timedelta(days=RETENTION_KEEP_ALL_DAYS)
+        last_bucket = None
+        cursor = None
+        while True:
+            query = db.session.query(FloorImage.id, FloorImage.timestamp).filter(
+                FloorImage.floor_id == floor_id, FloorImage.timestamp < cutoff,
+            )
+            if cursor:
+                query = query.filter(or_(
+                    FloorImage.timestamp < cursor[0],
+                    and_(FloorImage.timestamp == cursor[0], FloorImage.id < cursor[1]),
+                ))
+            rows = query.order_by(FloorImage.timestamp.desc(), FloorImage.id.desc()).limit(page_size).all()
+            if not rows:
+                return
+            for image_id, timestamp in rows:
+                bucket = RetentionService.bucket(timestamp, now)
+                if bucket != last_bucket:
+                    last_bucket = bucket
+                    continue
+                if image_id != latest_image_id:
+                    yield image_id
+            cursor = (rows[-1].timestamp, rows[-1].id)
+
+    @staticmethod
+    def delete_images(image_ids):
+        """
+        Deletes images with their analyses and jobs in one short transaction,
+        then removes blobs no other image still references.
+
+        Returns:
+            int: Bytes of blob payload removed.
+        """
+        digests = RetentionService.remove_images(image_ids)
+        db.session.commit()
+
+        return RetentionService.delete_unused_blobs(digests)
+
+    @staticmethod
+    def remove_images(image_ids):
+        """
+        Deletes images with their analyses, fingerprints and jobs in the
+        current transaction. The caller commits, then passes the result to
+        `delete_unused_blobs`.
+
+        Returns:
+            dict: Blob size by digest of the deleted images.
+        """
+        images = db.session.query(FloorImage.id, FloorImage.sha256, FloorImage.size) \
+            .filter(FloorImage.id.in_(image_ids)).all()
+        digests = {image.sha256: image.size for image in images}
+
+        ImageAnalysis.query.filter(ImageAnalysis.image_id.in_(image_ids)).delete(synchronize_session=False)
+        ImageFingerprint.query.filter(ImageFingerprint.image_id.in_(image_ids)).delete(synchronize_session=False)
+        AnalysisJob.query.filter(AnalysisJob.image_id.in_(image_ids)).delete(synchronize_session=False)
+        # Partial jobs based on a deleted image fall back to a full analysis.
+        AnalysisJob.query.filter(AnalysisJob.base_image_id.in_(image_ids)).update(
+            {'base_image_id': None, 'cells': None}, synchronize_session=False,
+        )
+        FloorImage.query.filter(FloorImage.id.in_(image_ids)).delete(synchronize_session=False)
+
+        return digests
+
+    @staticmethod
+    def delete_unused_blobs(digests):
+        """
+        Removes the blobs and thumbnails of `digests` that no image still
+        references.
+
+        Returns:
+            int: Bytes of blob payload removed.
+        """
+        still_used = {
+            row.sha256 for row in db.session.query(FloorImage.sha256).filter(FloorImage.sha256.in_(digests.keys()))
+        }
+        freed = 0
+        for digest, size in digests.items():
+            if digest in still_used:
+                continue
+            blob_store.delete(digest)
+            derivative_cache.delete(digest)
+            freed += size
+
+        return freed
+
+    @staticmethod
+    def incremental_vacuum(pages):
+        if db.engine.dialect.name != 'sqlite':
+            return
+        db.session.commit()
+        # sqlite3's execute() steps the pragma once and frees a single page;
+        # executescript() runs it to completion.
+        connection = db.session.connection().connection.driver_connection
+        connection.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        db.session.commit()
+
+class CalibrationService():
+    @staticmethod
+    def get(id):
+        floor = Floor.query.filter_by(id=id).first()
+        if not floor:
+            raise Exception("Floor not found")
+        if not floor.calibration:
+            raise Exception("Floor is not calibrated")
+
+        return floor.calibration
+
+    @staticmethod
+    def update(id, corners, output_size, grid, layout=None):
+        floor = Floor.query.filter_by(id=id).first()
+        if not floor:
+            raise Exception("Floor not found")
+        calibration = floor.calibration or FloorCalibration(floor_id=floor.id)
+        calibration.corners = corners
+        calibration.output_width, calibration.output_height = output_size
+        calibration.rows, calibration.cols = grid
+        calibration.layout = layout
+        db.session.add(calibration)
+        db.session.commit()
+
+        return calibration
+
+class AnalysisService():
+    @staticmethod
+    def layout(floor, grid=DEFAULT_GRID):
+        """
+        FloorLinen per grid cell in row-major order. Calibrated floors map
+        each cell's LinenType to the floor's FloorLinen of that type; other
+        floors cycle their linens across the cells like the sample layout
+        in scripts/main.py.
+        """
+        cells = grid[0] * grid[1]
+        floor_linens = sorted(floor.floor_linen, key=lambda floor_linen: floor_linen.id)
+        calibration = floor.calibration
+        if calibration and calibration.layout:
+            by_type = {}
+            for floor_linen in floor_linens:
+                by_type.setdefault(floor_linen.ltype_id, floor_linen)
+            return [by_type.get(ltype_id) for ltype_id in calibration.layout]
+
+        if not floor_linens:
+            return [None] * cells
+
+        return [floor_linens[i % len(floor_linens)] for i in range(cells)]
+
+    @staticmethod
+    def geometry(calibration):
+        """
+        Corners, output size and grid of a calibration, or the defaults.
+        """
+        if calibration:
+            return {
+                'coords': [tuple(point) for point in calibration.corners],
+                'output_size': (calibration.output_width, calibration.output_height),
+                'grid': (calibration.rows, calibration.cols),
+            }
+
+        return {'coords': DEFAULT_CORNERS, 'output_size': DEFAULT_OUTPUT_SIZE, 'grid': DEFAULT_GRID}
+
+    @staticmethod
+    def geometry_key(geometry):
+        return hashlib.sha1(json.dumps(geometry, sort_keys=True).encode('ascii')).hexdigest()
+
+    @staticmethod
+    def plan(floor):
+        """
+        Analysis options for a floor's images and the FloorLinen id per cell.
+
+        Returns:
+            (dict, list): Keyword arguments for `analysis.analyze_image` and
+            the layout ids to pass to `apply`.
+        """
+        options = AnalysisService.geometry(floor.calibration if floor else None)
+        layout = AnalysisService.layout(floor, options['grid']) if floor else [None] * (options['grid'][0] * options['grid'][1])
+        options['linen_types'] = [floor_linen.ltype.name if floor_linen else None for floor_linen in layout]
+
+        return options, [floor_linen.id if floor_linen else None for floor_linen in layout]
+
+    @staticmethod
+    def apply(floor_id, image_id, sections, layout_ids):
+        return AnalysisService.apply_many([(floor_id, image_id, sections, layout_ids)])[0]
+
+    @staticmethod
+    def apply_many(results):
+        """
+        Stores per-cell results for many images with a fixed number of
+        queries. Each result is a (floor_id, image_id, sections, layout_ids)
+        tuple; FloorLinen quantities are only overwritten for images that
+        are still their floor's latest, and a FloorLinen the layout maps no
+        cell to is set to 0. The caller commits.
+        """
+        image_ids = [image_id for _, image_id, _, _ in results]
+        floor_ids = {floor_id for floor_id, _, _, _ in results if floor_id is not None}
+        analyses = {
+            image_analysis.image_id: image_analysis
+            for image_analysis in ImageAnalysis.query.filter(ImageAnalysis.image_id.in_(image_ids))
+        }
+        latest_image_ids = dict(
+            db.session.query(Floor.id, Floor.latest_image_id).filter(Floor.id.in_(floor_ids))
+        )
+
+        now = datetime.utcnow()
+        quantities = {}
+        updated_floor_ids = set()
+        stored = []
+        first_analyses = []
+        for floor_id, image_id, sections, layout_ids in results:
+            image_analysis = analyses.get(image_id)
+            if image_analysis is None:
+                image_analysis = analyses[image_id] = ImageAnalysis(image_id=image_id)
+                db.session.add(image_analysis)
+                if floor_id is not None:
+                    first_analyses.append((floor_id, image_id, sections, layout_ids))
+            image_analysis.sections = sections
+            image_analysis.analyzed_at = now
+            stored.append(image_analysis)
+
+            if floor_id is None or latest_image_ids.get(floor_id) != image_id:
+                continue
+            updated_floor_ids.add(floor_id)
+            for section, floor_linen_id in zip(sections, layout_ids):
+                if floor_linen_id is None:
+                    continue
+                quantities.setdefault(floor_linen_id, 0)
+                if section['status'] != 'empty':
+                    quantities[floor_linen_id] += 1
+
+        if updated_floor_ids:
+            changes = []
+            for floor_linen in FloorLinen.query.filter(FloorLinen.floor_id.in_(updated_floor_ids)):
+                quantity = quantities.get(floor_linen.id, 0)
+                changes.append((floor_linen.floor_id, floor_linen.ltype_id, quantity - (floor_linen.quantity or 0), 0))
+                floor_linen.quantity = quantity
+            InventoryService.adjust(changes)
+            VersionService.bump(FLOORS_VERSION, *[floor_version_key(floor_id) for floor_id in updated_floor_ids])
+            EventService.record(FloorEvent.ANALYSIS, *updated_floor_ids)
+        # Re-analyses (reanalyze.py) leave the recorded history as it was.
+        FillLevelService.record_analyses(first_analyses)
+
+        return stored
+
+class ChangeDetectionService():
+    """
+    Decides at upload time how much of a new image needs analyzing, by
+    comparing its fingerprint (see `analysis.fingerprint_image`) with that of
+    the floor's previous, already analyzed image.
+    """
+    DEDUPLICATED = 'deduplicated'
+    PARTIAL = 'partial'
+    FULL = 'full'
+
+    @staticmethod
+    def fingerprint(floor_id, sha256):
+        """
+        Fingerprints a stored blob with the floor's calibration.
+
+        Returns:
+            dict: ImageFingerprint columns, or None if the image cannot be decoded.
+        """
+        calibration = FloorCalibration.query.filter_by(floor_id=floor_id).first()
+        geometry = AnalysisService.geometry(calibration)
+        # Do not hold a pooled connection during the CPU work.
+        db.session.commit()
+
+        # OpenCV is only loaded by web workers once an upload needs it.
+        from analysis import AnalysisError, fingerprint_image
+
+        try:
+            fingerprint = run_blocking(fingerprint_image, blob_store.read(sha256), **geometry)
+        except AnalysisError:
+            return None
+
+        return {
+            'geometry': AnalysisService.geometry_key(geometry),
+            'phash': fingerprint.phash,
+            'cells': fingerprint.cells,
+        }
+
+    @staticmethod
+    def compare(floor, sha256, fingerprint):
+        """
+        Compares an upload with the floor's latest image. Images whose
+        perceptual hashes are within CHANGE_HASH_DISTANCE bits and whose cell
+        colors are all within CHANGE_CELL_TOLERANCE are deduplicated; if at
+        most CHANGE_PARTIAL_MAX_RATIO of the cells changed, only those are
+        analyzed again.
+
+        Returns:
+            (str, FloorImage, list, dict): The outcome, the image it is based
+            on, the changed cell indexes and the fingerprint to store. Cells
+            that are not re-analyzed keep the base image's fingerprint, so
+            small changes cannot accumulate unnoticed.
+        """
+        base_image = floor.latest_image
+        if (
+            fingerprint is None
+            or base_image is None
+            or base_image.analysis is None
+            or base_image.fingerprint is None
+            or base_image.fingerprint.geometry != fingerprint['geometry']
+        ):
+            return ChangeDetectionService.FULL, None, None, fingerprint
+
+        from analysis import changed_cells, hash_distance
+
+        base = base_image.fingerprint
+        base_fingerprint = {'geometry': base.geometry, 'phash': base.phash, 'cells': base.cells}
+        if base_image.sha256 == sha256:
+            return ChangeDetectionService.DEDUPLICATED, base_image, [], base_fingerprint
+
+        cells = changed_cells(base.cells, fingerprint['cells'], CHANGE_CELL_TOLERANCE)
+        if cells is None:
+            return ChangeDetectionService.FULL, None, None, fingerprint
+        if not cells:
+            if hash_distance(base.phash, fingerprint['phash']) <= CHANGE_HASH_DISTANCE:
+                return ChangeDetectionService.DEDUPLICATED, base_image, [], base_fingerprint
+            return ChangeDetectionService.FULL, None, None, fingerprint
+        if len(cells) > CHANGE_PARTIAL_MAX_RATIO * len(base_image.analysis.sections):
+            return ChangeDetectionService.FULL, None, None, fingerprint
+
+        merged = [[list(cell) for cell in row] for row in base.cells]
+        cols = len(merged[0])
+        for index in cells:
+            row, col = divmod(index, cols)
+            merged[row][col] = fingerprint['cells'][row][col]
+
+        return ChangeDetectionService.PARTIAL, base_image, cells, {**fingerprint, 'cells': merged}
+
+    @staticmethod
+    def reuse_analysis(floor, floor_image, base_image):
+        """
+        Stores a copy of the base image's analysis for a deduplicated upload,
+        with linen types from the floor's current layout.
+        """
+        options, layout_ids = AnalysisService.plan(floor)
+        sections = [
+            dict(section, linen_type=linen_type)
+            for section, linen_type in zip(base_image.analysis.sections, options['linen_types'])
+        ]
+        AnalysisService.apply(floor.id, floor_image.id, sections, layout_ids)
+
+class AnalysisJobService():
+    @staticmethod
+    def enqueue(floor_id, image_id, base_image_id=None, cells=None):
+        """
+        Adds a job to the session. Queued jobs for older images of the same
+        floor are superseded, so only the newest upload gets analyzed. Given
+        `base_image_id` and `cells`, only those cells are analyzed.
+        """
+        AnalysisJob.query.filter_by(floor_id=floor_id, status=AnalysisJob.PENDING).update(
+            {'status': AnalysisJob.SUPERSEDED, 'updated_at': datetime.utcnow()}
+        )
+        job = AnalysisJob(
+            floor_id=floor_id, image_id=image_id, base_image_id=base_image_id, cells=cells,
+            status=AnalysisJob.PENDING,
+        )
+        db.session.add(job)
+        db.session.flush()
+
+        return job
+
+    @staticmethod
+    def claim_next():
+        """
+        Atomically moves the oldest available pending job to running. Safe to
+        call from several worker processes at once.
+        """
+        while True:
+            job = AnalysisJob.query.filter(
+                AnalysisJob.status == AnalysisJob.PENDING,
+                AnalysisJob.available_at <= datetime.utcnow(),
+            ).order_by(AnalysisJob.id).first()
+            if not job:
+                db.session.rollback()
+                return None
+
+            claimed = AnalysisJob.query.filter_by(id=job.id, status=AnalysisJob.PENDING).update(
+                {'status': AnalysisJob.RUNNING, 'attempts': AnalysisJob.attempts + 1, 'updated_at': datetime.utcnow()}
+            )
+            db.session.commit()
+            if claimed:
+                db.session.refresh(job)
+                return job
+
+    @staticmethod
+    def complete(job_id, sections, layout_ids):
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None:
+            # Its image or floor was deleted while it ran.
+            return
+        AnalysisService.apply(job.floor_id, job.image_id, sections, layout_ids)
+        job.status = AnalysisJob.DONE
+        job.error = None
         db.session.commit()
 
+    @staticmethod
+    def fail(job_id, error, retry=True):
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None:
+            return
+        job.error = error
+        if retry and job.attempts < ANALYSIS_MAX_ATTEMPTS:
+            job.status = AnalysisJob.PENDING
+            job.available_at = datetime.utcnow() + timedelta(seconds=ANALYSIS_RETRY_DELAY * job.attempts)
+        else:
+            job.status = AnalysisJob.FAILED
+        db.session.commit()
+
+    @staticmethod
+    def requeue_stale(timeout):
+        """
+        Returns jobs left running for longer than `timeout` seconds, e.g. by a
+        worker that was killed mid-job, to the queue.
+        """
+        requeued = AnalysisJob.query.filter(
+            AnalysisJob.status == AnalysisJob.RUNNING,
+            AnalysisJob.updated_at < datetime.utcnow() - timedelta(seconds=timeout),
+        ).update({'status': AnalysisJob.PENDING, 'updated_at': datetime.utcnow()})
+        db.session.commit()
+
+        return requeued
+
+    @staticmethod
+    def latest(floor_id):
+        job = AnalysisJob.query.filter_by(floor_id=floor_id).order_by(AnalysisJob.id.desc()).first()
+        if not job:
+            raise Exception("No analysis for floor")
+
+        return job
+
 class LinenTypeService():
+    @staticmethod
+    def require(ids):
+        """
+        Raises unless every id in `ids` is a LinenType, with one query.
+        """
+        ids = set(ids)
+        if not ids:
+            return
+        found = db.session.query(db.func.count(LinenType.id)).filter(LinenType.id.in_(ids)).scalar()
+        if found != len(ids):
+            raise Exception("Linen Type not found")
+
     @staticmethod
     def create(name):
         linen_type = LinenType()
         linen_type.name = name
         db.session.add(linen_type)
+        db.session.flush()
+        InventoryService.add_linen_type(linen_type.id)
+        VersionService.bump(LINEN_TYPES_VERSION)
         db.session.commit()
 
     @staticmethod
@@ -87,5 +913,323 @@ class LinenTypeService():
 
     @staticmethod
     def delete(id):
+        floor_ids = [row.floor_id for row in FloorLinen.query.filter_by(ltype_id=id).with_entities(FloorLinen.floor_id).distinct()]
+        InventoryService.remove_linen_type(id)
+        FillLevelService.remove_linen_type(id)
         LinenType.query.filter_by(id=id).delete()
+        VersionService.bump(LINEN_TYPES_VERSION, FLOORS_VERSION, *[floor_version_key(floor_id) for floor_id in floor_ids])
+        EventService.record(FloorEvent.LINENS, *floor_ids)
         db.session.commit()
+
+class InventoryService():
+    """
+    Maintains the LinenTypeInventory and FloorInventory summary tables.
+    Every write to FloorLinen reports its changes here in the same
+    transaction, so totals are adjusted in place instead of being
+    aggregated from FloorLinen on every read.
+    """
+    @staticmethod
+    def add_floors(*floor_ids):
+        if floor_ids:
+            db.session.execute(insert(FloorInventory), [
+                {'floor_id': floor_id, 'quantity': 0, 'linen_types': 0} for floor_id in floor_ids
+            ])
+
+    @staticmethod
+    def add_linen_type(ltype_id):
+        db.session.execute(insert(LinenTypeInventory).values(ltype_id=ltype_id, quantity=0, floors=0))
+
+    @staticmethod
+    def adjust(changes):
+        """
+        Applies FloorLinen changes to both tables with one batched UPDATE each.
+
+        Parameters:
+            changes (iterable): (floor_id, ltype_id, quantity_delta, count_delta)
+                tuples; count_delta is 1 for an added FloorLinen, -1 for a
+                removed one and 0 for a quantity change.
+        """
+        floors = {}
+        linen_types = {}
+        for floor_id, ltype_id, quantity, count in changes:
+            if not quantity and not count:
+                continue
+            floor = floors.setdefault(int(floor_id), [0, 0])
+            floor[0] += quantity
+            floor[1] += count
+            linen_type = linen_types.setdefault(int(ltype_id), [0, 0])
+            linen_type[0] += quantity
+            linen_type[1] += count
+
+        for table, key, counter, totals in (
+            (FloorInventory.__table__, 'floor_id', 'linen_types', floors),
+            (LinenTypeInventory.__table__, 'ltype_id', 'floors', linen_types),
+        ):
+            if not totals:
+                continue
+            db.session.execute(
+                update(table).where(table.c[key] == bindparam('b_key')).values({
+                    'quantity': table.c.quantity + bindparam('b_quantity'),
+                    counter: table.c[counter] + bindparam('b_count'),
+                }),
+                [{'b_key': key_id, 'b_quantity': quantity, 'b_count': count}
+                 for key_id, (quantity, count) in totals.items()],
+            )
+
+    @staticmethod
+    def remove_floor(floor_id):
+        """
+        Deletes a floor's FloorLinens and takes them out of the linen type totals.
+        """
+        rows = db.session.query(FloorLinen.ltype_id, FloorLinen.quantity).filter_by(floor_id=floor_id).all()
+        InventoryService.adjust([(floor_id, ltype_id, -(quantity or 0), -1) for ltype_id, quantity in rows])
+        FloorLinen.query.filter_by(floor_id=floor_id).delete(synchronize_session=False)
+        FloorInventory.query.filter_by(floor_id=floor_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def remove_linen_type(ltype_id):
+        """
+        Deletes a linen type's FloorLinens and takes them out of the floor totals.
+        """
+        rows = db.session.query(FloorLinen.floor_id, FloorLinen.quantity).filter_by(ltype_id=ltype_id).all()
+        InventoryService.adjust([(floor_id, ltype_id, -(quantity or 0), -1) for floor_id, quantity in rows])
+        FloorLinen.query.filter_by(ltype_id=ltype_id).delete(synchronize_session=False)
+        LinenTypeInventory.query.filter_by(ltype_id=ltype_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def rebuild():
+        """
+        Recomputes both tables from FloorLinen, e.g. after a migration. The
+        caller commits.
+        """
+        FloorInventory.query.delete(synchronize_session=False)
+        LinenTypeInventory.query.delete(synchronize_session=False)
+        db.session.execute(insert(FloorInventory).from_select(
+            ['floor_id', 'quantity', 'linen_types'],
+            select(Floor.id, db.func.coalesce(db.func.sum(FloorLinen.quantity), 0), db.func.count(FloorLinen.id))
+            .outerjoin(FloorLinen, FloorLinen.floor_id == Floor.id)
+            .group_by(Floor.id),
+        ))
+        db.session.execute(insert(LinenTypeInventory).from_select(
+            ['ltype_id', 'quantity', 'floors'],
+            select(LinenType.id, db.func.coalesce(db.func.sum(FloorLinen.quantity), 0), db.func.count(FloorLinen.id))
+            .outerjoin(FloorLinen, FloorLinen.ltype_id == LinenType.id)
+            .group_by(LinenType.id),
+        ))
+
+    @staticmethod
+    def linen_type_totals():
+        return db.session.execute(
+            select(LinenType.id, LinenType.name, LinenTypeInventory.quantity, LinenTypeInventory.floors)
+            .join(LinenTypeInventory, LinenTypeInventory.ltype_id == LinenType.id)
+            .order_by(LinenType.id)
+        ).all()
+
+    @staticmethod
+    def floor_totals():
+        return db.session.execute(
+            select(Floor.id, Floor.name, FloorInventory.quantity, FloorInventory.linen_types)
+            .join(FloorInventory, FloorInventory.floor_id == Floor.id)
+            .order_by(Floor.id)
+        ).all()
+
+    @staticmethod
+    def floors_below(threshold, ltype_id=None):
+        """
+        Floors with fewer than `threshold` linens in total, or of one linen
+        type, lowest first. Floors that do not stock the type are left out.
+        Both are range scans: on floor_inventory.quantity, or on the
+        (ltype_id, quantity) index of floor_linen.
+        """
+        if ltype_id is None:
+            query = select(Floor.id, Floor.name, FloorInventory.quantity) \
+                .join(FloorInventory, FloorInventory.floor_id == Floor.id) \
+                .where(FloorInventory.quantity < threshold) \
+                .order_by(FloorInventory.quantity, Floor.id)
+        else:
+            query = select(Floor.id, Floor.name, FloorLinen.quantity) \
+                .join(FloorLinen, FloorLinen.floor_id == Floor.id) \
+                .where(FloorLinen.ltype_id == ltype_id, FloorLinen.quantity < threshold) \
+                .order_by(FloorLinen.quantity, Floor.id)
+
+        return db.session.execute(query).all()
+
+class FillLevelService():
+    """
+    Fill-level history. Every first analysis of an image appends one
+    FillLevelSample per linen type and folds it into FillLevelRollup at
+    each resolution, so charts read a few pre-aggregated rows per bucket
+    instead of image analyses. Buckets are Unix seconds (UTC), which SQLite
+    compares and returns without parsing dates.
+    """
+    EPOCH = datetime(1970, 1, 1)
+    RESOLUTIONS = {'5m': 300, 'hour': 3600, 'day': 86400}
+
+    @staticmethod
+    def seconds(timestamp):
+        return int((timestamp - FillLevelService.EPOCH).total_seconds())
+
+    @staticmethod
+    def bucket(timestamp, resolution):
+        step = FillLevelService.RESOLUTIONS[resolution]
+        return FillLevelService.seconds(timestamp) // step * step
+
+    @staticmethod
+    def record_analyses(results):
+        """
+        Records (floor_id, image_id, sections, layout_ids) results as
+        AnalysisService.apply_many receives them.
+        """
+        if not results:
+            return
+
+        floor_linen_ids = {id for _, _, _, layout_ids in results for id in layout_ids if id is not None}
+        ltype_ids = dict(
+            db.session.query(FloorLinen.id, FloorLinen.ltype_id).filter(FloorLinen.id.in_(floor_linen_ids))
+        )
+        timestamps = dict(
+            db.session.query(FloorImage.id, FloorImage.timestamp)
+            .filter(FloorImage.id.in_([image_id for _, image_id, _, _ in results]))
+        )
+        FillLevelService.record([
+            (floor_id, image_id, timestamps[image_id], sections, [ltype_ids.get(id) for id in layout_ids])
+            for floor_id, image_id, sections, layout_ids in results
+            if image_id in timestamps
+        ])
+
+    @staticmethod
+    def record(analyses):
+        """
+        Appends samples and updates the rollups, with one batched INSERT
+        into each table. The caller commits.
+
+        Parameters:
+            analyses (list): (floor_id, image_id, timestamp, sections,
+                ltype_ids) tuples, `ltype_ids` giving each cell's linen
+                type id or None.
+        """
+        samples = []
+        for floor_id, image_id, timestamp, sections, ltype_ids in analyses:
+            by_type = {}
+            for section, ltype_id in zip(sections, ltype_ids):
+                if ltype_id is None:
+                    continue
+                stats = by_type.setdefault(ltype_id, [0, 0, 0.0])
+                stats[0] += section['status'] != 'empty'
+                stats[1] += 1
+                stats[2] += section['white_ratio']
+            samples += [
+                {
+                    'floor_id': int(floor_id), 'ltype_id': ltype_id, 'image_id': image_id, 'timestamp': timestamp,
+                    'quantity': quantity, 'cells': cells, 'fill': fill / cells,
+                }
+                for ltype_id, (quantity, cells, fill) in by_type.items()
+            ]
+        if not samples:
+            return
+
+        db.session.execute(insert(FillLevelSample), samples)
+        FillLevelService.roll_up(samples)
+        VersionService.bump(FILL_LEVELS_VERSION)
+
+    @staticmethod
+    def roll_up(samples):
+        rollups = {}
+        for sample in samples:
+            for resolution in FillLevelService.RESOLUTIONS:
+                key = (resolution, sample['floor_id'], sample['ltype_id'],
+                       FillLevelService.bucket(sample['timestamp'], resolution))
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = {
+                        'resolution': key[0], 'floor_id': key[1], 'ltype_id': key[2], 'bucket': key[3],
+                        'samples': 1, 'quantity_sum': sample['quantity'], 'quantity_min': sample['quantity'],
+                        'quantity_max': sample['quantity'], 'fill_sum': sample['fill'],
+                    }
+                    continue
+                rollup['samples'] += 1
+                rollup['quantity_sum'] += sample['quantity']
+                rollup['quantity_min'] = min(rollup['quantity_min'], sample['quantity'])
+                rollup['quantity_max'] = max(rollup['quantity_max'], sample['quantity'])
+                rollup['fill_sum'] += sample['fill']
+
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        table = FillLevelRollup.__table__
+        statement = upsert(table)
+        new = statement.excluded
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.resolution, table.c.floor_id, table.c.ltype_id, table.c.bucket],
+                set_={
+                    'samples': table.c.samples + new.samples,
+                    'quantity_sum': table.c.quantity_sum + new.quantity_sum,
+                    'quantity_min': case((new.quantity_min < table.c.quantity_min, new.quantity_min),
+                                         else_=table.c.quantity_min),
+                    'quantity_max': case((new.quantity_max > table.c.quantity_max, new.quantity_max),
+                                         else_=table.c.quantity_max),
+                    'fill_sum': table.c.fill_sum + new.fill_sum,
+                },
+            ),
+            list(rollups.values()),
+        )
+
+    @staticmethod
+    def remove_floor(floor_id):
+        FillLevelSample.query.filter_by(floor_id=floor_id).delete(synchronize_session=False)
+        FillLevelRollup.query.filter_by(floor_id=floor_id).delete(synchronize_session=False)
+        VersionService.bump(FILL_LEVELS_VERSION)
+
+    @staticmethod
+    def remove_linen_type(ltype_id):
+        FillLevelSample.query.filter_by(ltype_id=ltype_id).delete(synchronize_session=False)
+        FillLevelRollup.query.filter_by(ltype_id=ltype_id).delete(synchronize_session=False)
+        VersionService.bump(FILL_LEVELS_VERSION)
+
+    @staticmethod
+    def series(resolution, start, end, floor_id=None, ltype_id=None):
+        """
+        Rollups of the buckets from the one holding `start` up to `end`,
+        ordered by floor, linen type and bucket, with the means computed.
+        """
+        query = select(
+            FillLevelRollup.floor_id, FillLevelRollup.ltype_id, FillLevelRollup.bucket,
+            db.func.round(FillLevelRollup.quantity_sum * 1.0 / FillLevelRollup.samples, 2),
+            FillLevelRollup.quantity_min, FillLevelRollup.quantity_max,
+            db.func.round(FillLevelRollup.fill_sum / FillLevelRollup.samples, 4),
+        ).where(
+            FillLevelRollup.resolution == resolution,
+            FillLevelRollup.bucket >= FillLevelService.bucket(start, resolution),
+            FillLevelRollup.bucket < FillLevelService.seconds(end),
+        )
+        if floor_id is not None:
+            query = query.where(FillLevelRollup.floor_id == floor_id)
+        if ltype_id is not None:
+            query = query.where(FillLevelRollup.ltype_id == ltype_id)
+
+        return db.session.execute(
+            query.order_by(FillLevelRollup.floor_id, FillLevelRollup.ltype_id, FillLevelRollup.bucket)
+        ).all()
+
+    @staticmethod
+    def prune(samples_before, fine_before):
+        """
+        Drops raw samples older than `samples_before` and 5 minute rollups
+        older than `fine_before`; hourly and daily rollups are kept.
+
+        Returns:
+            (int, int): Samples and rollup rows deleted.
+        """
+        samples = FillLevelSample.query.filter(FillLevelSample.timestamp < samples_before) \
+            .delete(synchronize_session=False)
+        rollups = FillLevelRollup.query.filter(
+            FillLevelRollup.resolution == '5m',
+            FillLevelRollup.bucket < FillLevelService.seconds(fine_before),
+        ).delete(synchronize_session=False)
+        if rollups:
+            VersionService.bump(FILL_LEVELS_VERSION)
+        db.session.commit()
+
+        return samples, rollups
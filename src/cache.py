@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+from werkzeug.http import is_resource_modified
+
+from compression import compress, negotiate_encoding, set_encoding
+from config import COMPRESS_MIN_BYTES, RESPONSE_CACHE_MAX_BYTES
+
+
+class LRUCache():
+    """
+    Thread-safe in-process cache bounded by the total size of its values.
+    The least recently used entries are evicted once `max_bytes` is exceeded.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+response_cache = LRUCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+def conditional_json_response(etag, last_modified, build):
+    """
+    Answers a conditional GET for a versioned resource. `build` is only
+    called when the client's copy is stale and the serialized body for
+    `etag` is not already cached. Bodies are cached per encoding, so a
+    popular version is compressed once rather than on every request.
+    """
+    encoding = negotiate_encoding()
+    identity_etag = etag
+    if encoding:
+        etag = f"{etag}-{encoding}"
+
+    response = Response(mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    # Compressed bodies are cached under the encoded ETag; bodies below
+    # COMPRESS_MIN_BYTES only ever under the identity one.
+    body = response_cache.get(etag) if encoding else None
+    if body is not None:
+        set_encoding(response, encoding)
+    else:
+        body = response_cache.get(identity_etag)
+        if body is None:
+            body = current_app.json.dumps(build()).encode('utf-8')
+            if not encoding or len(body) < COMPRESS_MIN_BYTES:
+                response_cache.set(identity_etag, body)
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            body = compress(body, encoding)
+            response_cache.set(etag, body)
+            set_encoding(response, encoding)
+
+    response.set_data(body)
+    return response
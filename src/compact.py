@@ -0,0 +1,73 @@
+"""
+Applies the image retention policy: every image is kept for
+RETENTION_KEEP_ALL_DAYS, then the newest per hour until
+RETENTION_HOURLY_DAYS, then the newest per day. A floor's latest image is
+always kept. Floor change events older than EVENTS_RETENTION_HOURS,
+fill-level samples older than FILL_LEVEL_RAW_RETENTION_DAYS and 5 minute
+fill-level rollups older than FILL_LEVEL_5M_RETENTION_DAYS are dropped as
+well.
+
+    cd src && python compact.py --dry-run
+
+Images are deleted in small batches, each its own short transaction, and
+freed pages are returned to the filesystem with incremental vacuum
+between batches so writers are never locked out for long.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--vacuum-pages', type=int, default=2000, help="Pages to release after each batch")
+    parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between batches")
+    parser.add_argument('--dry-run', action='store_true')
+    return parser.parse_args(argv)
+
+
+def compact(args):
+    from blueprints.models import Floor
+    from blueprints.services import EventService, FillLevelService, RetentionService
+    from config import EVENTS_RETENTION_HOURS, FILL_LEVEL_5M_RETENTION_DAYS, FILL_LEVEL_RAW_RETENTION_DAYS
+    from database import db
+
+    now = datetime.utcnow()
+    started = time.monotonic()
+    deleted = freed = 0
+
+    for (floor_id,) in db.session.query(Floor.id).order_by(Floor.id).all():
+        prunable = list(RetentionService.prunable(floor_id, now))
+        if args.dry_run:
+            print(f"Floor {floor_id}: would delete {len(prunable)} images")
+            deleted += len(prunable)
+            continue
+
+        for i in range(0, len(prunable), args.batch_size):
+            batch = prunable[i:i + args.batch_size]
+            freed += RetentionService.delete_images(batch)
+            RetentionService.incremental_vacuum(args.vacuum_pages)
+            deleted += len(batch)
+            time.sleep(args.pause)
+        if prunable:
+            print(f"Floor {floor_id}: deleted {len(prunable)} images")
+
+    if not args.dry_run:
+        events = EventService.prune(now - timedelta(hours=EVENTS_RETENTION_HOURS))
+        print(f"Deleted {events} floor events")
+        samples, rollups = FillLevelService.prune(
+            now - timedelta(days=FILL_LEVEL_RAW_RETENTION_DAYS), now - timedelta(days=FILL_LEVEL_5M_RETENTION_DAYS),
+        )
+        print(f"Deleted {samples} fill-level samples and {rollups} 5 minute rollups")
+
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {deleted} images, freed {freed / 1024 / 1024:.1f} MiB of blobs in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        compact(parse_args(sys.argv[1:]))
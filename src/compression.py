@@ -0,0 +1,78 @@
+"""
+Negotiated response compression. Brotli is used when the `brotli` package
+is installed and the client accepts it, gzip otherwise. Only textual
+responses above COMPRESS_MIN_BYTES are compressed; images are already
+compressed and event streams must not be buffered. Set COMPRESS_ENABLED=0
+when a reverse proxy compresses instead.
+"""
+import gzip
+
+from flask import request
+
+from config import COMPRESS_BROTLI_QUALITY, COMPRESS_ENABLED, COMPRESS_GZIP_LEVEL, COMPRESS_MIN_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript')
+
+
+def negotiate_encoding():
+    """
+    Returns the best encoding the client accepts, or None.
+    """
+    if not COMPRESS_ENABLED:
+        return None
+
+    accept_encoding = request.accept_encodings
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def set_encoding(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+
+def compress_response(response):
+    """
+    after_request hook compressing eligible responses that were not
+    compressed (and cached) by conditional_json_response already.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    set_encoding(response, encoding)
+    etag, weak = response.get_etag()
+    if etag:
+        # The compressed bytes are a different representation.
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
@@ -2,3 +2,55 @@ import os
 
 API_KEY = os.environ.get('API_KEY')
 DEBUG = os.environ.get('DEBUG', '').lower() in ("1", "true", "yes", "on")
+BLOB_STORAGE_PATH = os.environ.get('BLOB_STORAGE_PATH', 'instance/blobs')
+FAST_JSON = os.environ.get('FAST_JSON', 'true').lower() in ("1", "true", "yes", "on")
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ("1", "true", "yes", "on")
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+MAX_IMAGE_UPLOAD_BYTES = int(os.environ.get('MAX_IMAGE_UPLOAD_BYTES', 15 * 1024 * 1024))
+# Room for the base64 JSON upload route, which inflates an image by a third.
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', MAX_IMAGE_UPLOAD_BYTES * 4 // 3 + 1024 * 1024))
+ALLOWED_IMAGE_TYPES = os.environ.get('ALLOWED_IMAGE_TYPES', 'image/jpeg,image/png,image/webp').split(',')
+DERIVATIVE_CACHE_PATH = os.environ.get('DERIVATIVE_CACHE_PATH', 'instance/derivatives')
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get('DERIVATIVE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+ANALYSIS_ENABLED = os.environ.get('ANALYSIS_ENABLED', 'true').lower() in ("1", "true", "yes", "on")
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+ANALYSIS_MAX_ATTEMPTS = int(os.environ.get('ANALYSIS_MAX_ATTEMPTS', 3))
+ANALYSIS_RETRY_DELAY = float(os.environ.get('ANALYSIS_RETRY_DELAY', 30))
+ANALYSIS_POLL_INTERVAL = float(os.environ.get('ANALYSIS_POLL_INTERVAL', 1))
+ANALYSIS_JOB_TIMEOUT = float(os.environ.get('ANALYSIS_JOB_TIMEOUT', 600))
+CHANGE_DETECTION_ENABLED = os.environ.get('CHANGE_DETECTION_ENABLED', 'true').lower() in ("1", "true", "yes", "on")
+CHANGE_HASH_DISTANCE = int(os.environ.get('CHANGE_HASH_DISTANCE', 6))
+CHANGE_CELL_TOLERANCE = float(os.environ.get('CHANGE_CELL_TOLERANCE', 8))
+CHANGE_PARTIAL_MAX_RATIO = float(os.environ.get('CHANGE_PARTIAL_MAX_RATIO', 0.5))
+DATABASE_URI = os.environ.get('DATABASE_URI', 'sqlite:///database.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+RETENTION_KEEP_ALL_DAYS = int(os.environ.get('RETENTION_KEEP_ALL_DAYS', 7))
+RETENTION_HOURLY_DAYS = int(os.environ.get('RETENTION_HOURLY_DAYS', 30))
+FILL_LEVEL_RAW_RETENTION_DAYS = int(os.environ.get('FILL_LEVEL_RAW_RETENTION_DAYS', 90))
+FILL_LEVEL_5M_RETENTION_DAYS = int(os.environ.get('FILL_LEVEL_5M_RETENTION_DAYS', 30))
+FILL_LEVEL_MAX_POINTS = int(os.environ.get('FILL_LEVEL_MAX_POINTS', 5000))
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1))
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+EVENTS_BACKLOG_LIMIT = int(os.environ.get('EVENTS_BACKLOG_LIMIT', 1000))
+EVENTS_RETENTION_HOURS = int(os.environ.get('EVENTS_RETENTION_HOURS', 24))
+METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', 'instance/metrics')
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '').lower() in ("1", "true", "yes", "on")
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'instance/profiles')
+GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', min(os.cpu_count() or 1, 4)))
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 32))
+GUNICORN_WORKER_CONNECTIONS = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+GUNICORN_KEEPALIVE = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ("1", "true", "yes", "on")
+MIGRATE_ON_START = os.environ.get('MIGRATE_ON_START', 'true').lower() in ("1", "true", "yes", "on")
+GUNICORN_ANALYSIS_WORKER = os.environ.get('GUNICORN_ANALYSIS_WORKER', 'true').lower() in ("1", "true", "yes", "on")
+BLOCKING_POOL_WORKERS = int(os.environ.get('BLOCKING_POOL_WORKERS', 4))
@@ -1,3 +1,56 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import (
+    DATABASE_URI, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE,
+)
 
 db = SQLAlchemy()
+
+
+def engine_options(uri):
+    if uri.startswith('sqlite'):
+        # Every Gunicorn worker has its own small pool; SQLite serializes
+        # writers anyway, so more connections only add lock contention.
+        return {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': 0,
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+        }
+
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def init_database(app, uri=DATABASE_URI):
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL only fsyncs
+    # at checkpoints, which is still durable against application crashes.
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    # Only takes effect on new databases; migrations.py converts old ones.
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    cursor.close()
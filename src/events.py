@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+
+from config import EVENTS_BACKLOG_LIMIT, EVENTS_POLL_INTERVAL
+
+
+class EventBus():
+    """
+    Fans FloorEvents out to the SSE clients of one process. A single
+    background thread polls the event table for ids past the last one it
+    saw, so every Gunicorn worker follows the same SQLite-backed sequence
+    with one cheap query per interval, however many clients it serves.
+    The thread stops once the last client disconnects; the next one to
+    subscribe starts it again from the table's newest event, so events
+    written while nobody listened are neither buffered nor replayed here.
+    """
+    def __init__(self, poll_interval=EVENTS_POLL_INTERVAL, buffer_size=EVENTS_BACKLOG_LIMIT):
+        self.poll_interval = poll_interval
+        self.recent = deque(maxlen=buffer_size)
+        self.last_id = None
+        # Events up to this id are not in `recent`; they predate the thread.
+        self.buffered_after = None
+        self.subscribers = 0
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def subscribe(self, app):
+        """
+        Registers a client and returns the id of the newest event, which a
+        client without `Last-Event-ID` starts after.
+        """
+        from blueprints.services import EventService
+
+        with self.condition:
+            self.subscribers += 1
+            if self.thread is None:
+                with app.app_context():
+                    self.last_id = EventService.latest_id()
+                self.buffered_after = self.last_id
+                self.recent.clear()
+                self.thread = threading.Thread(target=self.run, args=(app,), daemon=True)
+                self.thread.start()
+            return self.last_id
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def run(self, app):
+        from blueprints.serializers import FloorEventSerializer
+        from blueprints.services import EventService
+        from database import db
+
+        with app.app_context():
+            while True:
+                with self.condition:
+                    if not self.subscribers:
+                        self.thread = None
+                        return
+                    last_id = self.last_id
+
+                try:
+                    events = FloorEventSerializer().serializeMany(EventService.since(last_id, self.recent.maxlen))
+                except Exception as e:
+                    app.logger.warning("Polling floor events failed: %s", e)
+                    events = []
+                finally:
+                    db.session.remove()
+
+                if events:
+                    with self.condition:
+                        self.recent.extend(events)
+                        self.last_id = events[-1]['id']
+                        self.condition.notify_all()
+                time.sleep(self.poll_interval)
+
+    def wait(self, after_id, timeout):
+        """
+        Blocks until there are events newer than `after_id` or `timeout`
+        seconds pass. Returns the buffered events, or None when the client
+        has fallen behind the buffer and must read the table itself.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.last_id is None or self.last_id <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.condition.wait(remaining)
+
+            if after_id < self.buffered_after:
+                return None
+            if self.recent and self.recent[0]['id'] > after_id + 1 and len(self.recent) == self.recent.maxlen:
+                return None
+            return [event for event in self.recent if event['id'] > after_id]
+
+
+event_bus = EventBus()
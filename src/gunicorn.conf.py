@@ -0,0 +1,108 @@
+"""
+Gunicorn settings and server hooks, loaded with
+`gunicorn -c src/gunicorn.conf.py`. Worker class and counts come from
+config.py (GUNICORN_* environment variables).
+
+The default gthread worker serves each connection on a thread, so a phone
+slowly uploading a photo holds one thread instead of a whole process.
+gevent is supported too (`pip install gevent`); SQLite calls then block
+its event loop, so prefer it only behind a proxy that buffers uploads.
+
+The app is preloaded in the master by default, so workers fork with Flask,
+SQLAlchemy and Pillow already imported and share those pages instead of
+each importing them again. The master also creates and migrates the schema
+once on start (MIGRATE_ON_START) rather than every worker doing it on boot.
+
+Unless GUNICORN_ANALYSIS_WORKER=0 or ANALYSIS_ENABLED=0, the master also
+runs the analysis worker (worker.py) as a child process and restarts it if
+it exits, so a single `gunicorn` command (as in the Docker image) processes
+the jobs uploads queue. Disable it when worker.py runs elsewhere.
+"""
+import os
+import subprocess
+import sys
+import threading
+
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SRC_PATH)
+
+from config import (  # noqa: E402
+    ANALYSIS_ENABLED, GUNICORN_ANALYSIS_WORKER, GUNICORN_KEEPALIVE, GUNICORN_PRELOAD, GUNICORN_THREADS,
+    GUNICORN_TIMEOUT, GUNICORN_WORKER_CLASS, GUNICORN_WORKER_CONNECTIONS, GUNICORN_WORKERS, MIGRATE_ON_START,
+)
+
+ANALYSIS_WORKER_RESTART_DELAY = 5
+
+worker_class = GUNICORN_WORKER_CLASS
+workers = GUNICORN_WORKERS
+# Gunicorn silently turns sync workers into gthread ones when threads > 1.
+threads = GUNICORN_THREADS if GUNICORN_WORKER_CLASS == 'gthread' else 1
+worker_connections = GUNICORN_WORKER_CONNECTIONS
+timeout = GUNICORN_TIMEOUT
+keepalive = GUNICORN_KEEPALIVE
+# gevent has to monkey-patch before the app is imported, which only happens
+# after the fork.
+preload_app = GUNICORN_PRELOAD and GUNICORN_WORKER_CLASS != 'gevent'
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be summed into /metrics.
+    from metrics import clear_metrics_dir
+
+    clear_metrics_dir()
+
+    if MIGRATE_ON_START:
+        from app import app
+        from database import db
+        from migrations import migrate
+
+        with app.app_context():
+            migrate()
+            # Workers must not inherit the master's SQLite connections.
+            db.engine.dispose()
+
+    if preload_app:
+        # Thumbnails import Pillow on first use; load it before forking.
+        import PIL.Image  # noqa: F401
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def supervise_analysis_worker(server, stopping):
+    while not stopping.is_set():
+        server.analysis_worker = subprocess.Popen([sys.executable, 'worker.py'], cwd=SRC_PATH)
+        code = server.analysis_worker.wait()
+        if stopping.is_set():
+            return
+        server.log.warning("Analysis worker exited with code %s, restarting", code)
+        stopping.wait(ANALYSIS_WORKER_RESTART_DELAY)
+
+
+def when_ready(server):
+    if not (ANALYSIS_ENABLED and GUNICORN_ANALYSIS_WORKER):
+        return
+
+    # Started after on_starting migrated the schema the worker polls.
+    server.analysis_worker_stopping = threading.Event()
+    threading.Thread(
+        target=supervise_analysis_worker, args=(server, server.analysis_worker_stopping), daemon=True,
+    ).start()
+
+
+def on_exit(server):
+    stopping = getattr(server, 'analysis_worker_stopping', None)
+    if stopping is None:
+        return
+
+    stopping.set()
+    worker = getattr(server, 'analysis_worker', None)
+    if worker is not None and worker.poll() is None:
+        worker.terminate()
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
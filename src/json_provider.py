@@ -0,0 +1,35 @@
+"""
+Optional faster JSON encoding through orjson. Enabled with FAST_JSON when
+orjson is installed; otherwise Flask's default provider is kept.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Drop-in JSON provider that encodes with orjson. Datetimes are passed
+    through to Flask's `default`, so they keep the HTTP date format clients
+    already parse; pretty-printed output (debug mode) falls back to json.
+    """
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_json(app, enabled):
+    if enabled and orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.json.sort_keys = False
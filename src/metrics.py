@@ -0,0 +1,101 @@
+"""
+Prometheus instrumentation: per-route latency, request/response bytes,
+SQL queries per request and image-analysis stage timings, exposed at
+`GET /metrics`.
+
+Every process (Gunicorn workers, the analysis worker and its pool) writes
+its samples to files in METRICS_DIR, and `/metrics` aggregates all of
+them, so a scrape sees the whole deployment rather than one worker.
+"""
+import os
+import time
+
+from flask import Response, g, request
+
+from config import METRICS_DIR
+
+if METRICS_DIR:
+    METRICS_DIR = os.path.abspath(METRICS_DIR)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    # prometheus_client picks its storage when it is first imported.
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = METRICS_DIR
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ['method', 'route', 'status'],
+)
+REQUEST_BYTES = Counter('http_request_bytes', 'Request body bytes received.', ['method', 'route'])
+RESPONSE_BYTES = Counter('http_response_bytes', 'Response body bytes sent, after compression.', ['method', 'route'])
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed per request.', ['route'],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 25, 50, 100),
+)
+REQUEST_QUERY_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements per request.', ['route'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+ANALYSIS_STAGE_SECONDS = Histogram(
+    'analysis_stage_duration_seconds', 'Image analysis time per pipeline stage.', ['stage'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+def route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    method, route = request.method, route_label()
+    REQUEST_LATENCY.labels(method, route, response.status_code).observe(time.perf_counter() - started)
+    REQUEST_BYTES.labels(method, route).inc(request.content_length or 0)
+    if response.content_length is not None:
+        RESPONSE_BYTES.labels(method, route).inc(response.content_length)
+    REQUEST_QUERIES.labels(route).observe(g.get('query_count', 0))
+    REQUEST_QUERY_SECONDS.labels(route).observe(g.get('query_seconds', 0))
+    return response
+
+
+def observe_analysis_stage(stage, seconds):
+    ANALYSIS_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def metrics_view():
+    if METRICS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """
+    Registers the hooks and the `/metrics` route. Call it before other
+    after_request hooks so the byte counts see the final, compressed body.
+    """
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def clear_metrics_dir():
+    """
+    Removes samples left by a previous run. Call it once when the server
+    starts, before any worker writes.
+    """
+    if not METRICS_DIR:
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith('.db'):
+            os.remove(os.path.join(METRICS_DIR, name))
@@ -1,5 +1,12 @@
-from flask import request, jsonify
-from config import API_KEY
+import cProfile
+import os
+import time
+from datetime import datetime
+
+from flask import request, jsonify, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import API_KEY, PROFILE_DIR
 
 
 def check_api_key():
@@ -7,3 +14,53 @@ def check_api_key():
 
     if not sent_api_key or sent_api_key != API_KEY:
         return jsonify({"error": "Unauthorized"}), 401
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+        conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is not None and has_app_context():
+        g.query_seconds = g.get('query_seconds', 0) + time.perf_counter() - started
+
+
+def add_query_count_header(response):
+    response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+    return response
+
+
+def start_profile():
+    """
+    Profiles the request with cProfile when it carries `X-Profile: 1`.
+    Only registered when PROFILE_ENABLED is set.
+    """
+    if request.headers.get('X-Profile') != '1':
+        return
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is already active in this process.
+        return
+    g.profile = profile
+
+
+def dump_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    profile.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+    path = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{endpoint}.prof")
+    profile.dump_stats(path)
+    response.headers['X-Profile-File'] = os.path.basename(path)
+    return response
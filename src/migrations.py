@@ -0,0 +1,232 @@
+from sqlalchemy import inspect, text
+
+from database import db
+from storage import blob_store, decode_base64_image
+
+BATCH_SIZE = 100
+
+
+def _columns(table):
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def _vacuum():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM'))
+
+
+def migrate_floor_images_to_blob_store():
+    """
+    Moves the base64 `floor_image.image` payloads into the blob store and
+    drops the column, keeping only the hash, size and mime type per row.
+    """
+    columns = _columns('floor_image')
+    if 'image' not in columns:
+        return
+
+    for name, ddl in (('sha256', 'VARCHAR(64)'), ('size', 'INTEGER'), ('mime_type', 'VARCHAR(50)')):
+        if name not in columns:
+            db.session.execute(text(f'ALTER TABLE floor_image ADD COLUMN {name} {ddl}'))
+    db.session.commit()
+
+    last_id = 0
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            text('SELECT id, image FROM floor_image '
+                 'WHERE id > :last_id AND sha256 IS NULL ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+
+        for id, image in rows:
+            data, mime_type = decode_base64_image(image or '')
+            db.session.execute(
+                text('UPDATE floor_image SET sha256 = :sha256, size = :size, mime_type = :mime_type '
+                     'WHERE id = :id'),
+                {'sha256': blob_store.put(data), 'size': len(data), 'mime_type': mime_type, 'id': id},
+            )
+        db.session.commit()
+        last_id = rows[-1][0]
+        moved += len(rows)
+
+    db.session.execute(text('ALTER TABLE floor_image DROP COLUMN image'))
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_floor_image_sha256 ON floor_image (sha256)'))
+    db.session.commit()
+    _vacuum()
+
+    print(f"Moved {moved} floor images to {blob_store.root}")
+
+
+def link_floor_images_to_floors():
+    """
+    Adds `floor_image.floor_id` and its indexes, filling it from analysis
+    jobs and from `floor.latest_image_id`. Older images that neither points
+    to stay unlinked.
+    """
+    if 'floor_id' in _columns('floor_image'):
+        return
+
+    db.session.execute(text('ALTER TABLE floor_image ADD COLUMN floor_id INTEGER REFERENCES floor (id)'))
+    db.session.execute(text(
+        'UPDATE floor_image SET floor_id = ('
+        'SELECT floor_id FROM analysis_job WHERE analysis_job.image_id = floor_image.id '
+        'ORDER BY analysis_job.id DESC LIMIT 1) WHERE floor_id IS NULL'
+    ))
+    db.session.execute(text(
+        'UPDATE floor_image SET floor_id = ('
+        'SELECT id FROM floor WHERE floor.latest_image_id = floor_image.id) WHERE floor_id IS NULL'
+    ))
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_floor_image_timestamp ON floor_image (timestamp)'))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_floor_image_floor_id_timestamp ON floor_image (floor_id, timestamp)'
+    ))
+    db.session.commit()
+
+
+def enable_incremental_vacuum():
+    """
+    Switches SQLite to incremental auto-vacuum so compaction can give pages
+    back a few at a time instead of with a full VACUUM.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.execute(text('PRAGMA auto_vacuum')).scalar() == 2:
+            return
+        conn.execute(text('PRAGMA auto_vacuum=INCREMENTAL'))
+        conn.execute(text('VACUUM'))
+
+
+def add_partial_analysis_to_jobs():
+    """
+    Adds `analysis_job.base_image_id` and `analysis_job.cells`, which let a
+    job re-analyze only the cells that changed since the previous image.
+    """
+    columns = _columns('analysis_job')
+    if 'cells' in columns:
+        return
+
+    db.session.execute(text('ALTER TABLE analysis_job ADD COLUMN base_image_id INTEGER REFERENCES floor_image (id)'))
+    db.session.execute(text('ALTER TABLE analysis_job ADD COLUMN cells JSON'))
+    db.session.commit()
+
+
+def add_floor_linen_constraints():
+    """
+    Merges FloorLinens that repeat a linen type on a floor (summing their
+    quantities), drops those whose floor or linen type was deleted, adds the
+    unique (floor_id, ltype_id) and (ltype_id, quantity) indexes and fills
+    the inventory summary tables.
+    """
+    from blueprints.services import InventoryService
+
+    inspector = inspect(db.engine)
+    names = {index['name'] for index in inspector.get_indexes('floor_linen')}
+    names |= {constraint['name'] for constraint in inspector.get_unique_constraints('floor_linen')}
+    if 'uq_floor_linen_floor_id_ltype_id' in names:
+        return
+
+    db.session.execute(text(
+        'UPDATE floor_linen SET quantity = ('
+        'SELECT SUM(COALESCE(dup.quantity, 0)) FROM floor_linen AS dup '
+        'WHERE dup.floor_id = floor_linen.floor_id AND dup.ltype_id = floor_linen.ltype_id) '
+        'WHERE id IN (SELECT MIN(id) FROM floor_linen GROUP BY floor_id, ltype_id HAVING COUNT(*) > 1)'
+    ))
+    db.session.execute(text(
+        'DELETE FROM floor_linen WHERE id NOT IN (SELECT MIN(id) FROM floor_linen GROUP BY floor_id, ltype_id)'
+    ))
+    db.session.execute(text(
+        'DELETE FROM floor_linen '
+        'WHERE floor_id NOT IN (SELECT id FROM floor) OR ltype_id NOT IN (SELECT id FROM linen_type)'
+    ))
+    db.session.execute(text(
+        'CREATE UNIQUE INDEX uq_floor_linen_floor_id_ltype_id ON floor_linen (floor_id, ltype_id)'
+    ))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_floor_linen_ltype_id_quantity ON floor_linen (ltype_id, quantity)'
+    ))
+    InventoryService.rebuild()
+    db.session.commit()
+
+
+def drop_orphan_floor_linens():
+    """
+    Drops FloorLinens whose linen type does not exist, which
+    `POST /floor/<id>/add_linen` used to accept, and refills the inventory
+    summary tables if there were any.
+    """
+    from blueprints.services import InventoryService
+
+    deleted = db.session.execute(text(
+        'DELETE FROM floor_linen WHERE ltype_id NOT IN (SELECT id FROM linen_type)'
+    )).rowcount
+    if deleted:
+        InventoryService.rebuild()
+    db.session.commit()
+
+
+def backfill_fill_levels():
+    """
+    Records fill-level history for images analysed before it was kept, from
+    their stored sections' linen type names, in batches of BATCH_SIZE.
+    """
+    from blueprints.models import FillLevelSample, FloorImage, ImageAnalysis, LinenType
+    from blueprints.services import FillLevelService
+
+    if db.session.query(FillLevelSample.id).first() is not None:
+        return
+
+    ltype_ids = dict(db.session.query(LinenType.name, LinenType.id))
+    query = db.session.query(FloorImage.floor_id, FloorImage.id, FloorImage.timestamp, ImageAnalysis.sections) \
+        .join(ImageAnalysis, ImageAnalysis.image_id == FloorImage.id) \
+        .filter(FloorImage.floor_id.isnot(None)) \
+        .order_by(FloorImage.id)
+    last_id = 0
+    while True:
+        rows = query.filter(FloorImage.id > last_id).limit(BATCH_SIZE).all()
+        if not rows:
+            break
+        FillLevelService.record([
+            (floor_id, image_id, timestamp, sections,
+             [ltype_ids.get(section.get('linen_type')) for section in sections])
+            for floor_id, image_id, timestamp, sections in rows
+        ])
+        db.session.commit()
+        last_id = rows[-1][1]
+
+
+MIGRATIONS = [
+    migrate_floor_images_to_blob_store,
+    link_floor_images_to_floors,
+    enable_incremental_vacuum,
+    add_partial_analysis_to_jobs,
+    add_floor_linen_constraints,
+    drop_orphan_floor_linens,
+    backfill_fill_levels,
+]
+
+
+def run_migrations():
+    for migration in MIGRATIONS:
+        migration()
+
+
+def migrate():
+    """
+    Creates missing tables, then runs the data migrations. Web workers no
+    longer do this on boot; run it once per deploy or let Gunicorn's master
+    run it on start.
+    """
+    db.create_all()
+    run_migrations()
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        migrate()
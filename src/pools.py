@@ -0,0 +1,47 @@
+"""
+Thread pool for blocking work: rendering thumbnails after the response is
+sent, or fingerprinting an upload before it is. Under gthread workers
+background tasks free the request thread; under gevent the pool is gevent's
+pool of real OS threads, so Pillow and OpenCV calls never stall the event
+loop.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BLOCKING_POOL_WORKERS, GUNICORN_WORKER_CLASS
+
+logger = logging.getLogger('osheet.pools')
+
+
+def create_pool(max_workers=BLOCKING_POOL_WORKERS):
+    if GUNICORN_WORKER_CLASS == 'gevent':
+        from gevent.threadpool import ThreadPool
+
+        return ThreadPool(max_workers)
+    return ThreadPoolExecutor(max_workers, thread_name_prefix='blocking')
+
+
+def run_in_background(fn, *args, description=None):
+    """
+    Runs `fn(*args)` on the blocking pool and logs, rather than raises,
+    its exceptions.
+    """
+    def run():
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.warning("Background task %s failed: %s", description or fn.__name__, e)
+
+    return blocking_pool.submit(run)
+
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Runs `fn` on the blocking pool and waits for its result, so CPU-bound
+    work the response depends on keeps gevent's event loop free. Exceptions
+    are re-raised in the caller.
+    """
+    return blocking_pool.submit(fn, *args, **kwargs).result()
+
+
+blocking_pool = create_pool()
@@ -0,0 +1,171 @@
+"""
+Re-runs linen analysis over the stored image history, e.g. after retuning
+the HSV bounds or the white threshold.
+
+    cd src && python reanalyze.py --since 2025-01-01 --white-threshold 190
+
+Images are read in keyset-paginated batches, analyzed in a process pool
+and written back one transaction per batch. Progress is checkpointed after
+every batch, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from analysis import DEFAULT_WHITE_THRESHOLD, LOWER_COLOR, UPPER_COLOR, analyze_image
+from database import db
+from storage import blob_store
+
+DEFAULT_CHECKPOINT = 'instance/reanalyze.checkpoint.json'
+
+
+def parse_color(value):
+    color = [int(part) for part in value.split(',')]
+    if len(color) != 3:
+        raise argparse.ArgumentTypeError("Expected H,S,V")
+    return color
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--since', type=datetime.fromisoformat, help="Only images taken at or after this ISO timestamp")
+    parser.add_argument('--white-threshold', type=int, default=DEFAULT_WHITE_THRESHOLD)
+    parser.add_argument('--lower-color', type=parse_color, default=LOWER_COLOR.tolist(), help="Lower HSV bound, e.g. 0,0,180")
+    parser.add_argument('--upper-color', type=parse_color, default=UPPER_COLOR.tolist(), help="Upper HSV bound, e.g. 180,60,255")
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+    return parser.parse_args(argv)
+
+
+def run_task(task):
+    image_id, path, options = task
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        return image_id, analyze_image(data, **options), None
+    except Exception as e:
+        return image_id, None, str(e)
+
+
+class Checkpoint():
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.last_id = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['options'] != self.options:
+            raise SystemExit(f"{self.path} was written with different options, rerun with --restart")
+        self.last_id = state['last_id']
+
+    def save(self, last_id):
+        self.last_id = last_id
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_id': last_id, 'options': self.options}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_plans():
+    from blueprints.models import Floor
+    from blueprints.services import AnalysisService
+
+    plans = {floor.id: AnalysisService.plan(floor) for floor in Floor.query.all()}
+    plans[None] = AnalysisService.plan(None)
+    return plans
+
+
+def batches(last_id, since, batch_size):
+    from blueprints.models import FloorImage
+
+    while True:
+        query = db.session.query(FloorImage.id, FloorImage.floor_id, FloorImage.sha256).filter(FloorImage.id > last_id)
+        if since:
+            query = query.filter(FloorImage.timestamp >= since)
+        rows = query.order_by(FloorImage.id).limit(batch_size).all()
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def reanalyze(args):
+    from blueprints.services import AnalysisService
+
+    options = {
+        'white_threshold': args.white_threshold,
+        'lower_color': args.lower_color,
+        'upper_color': args.upper_color,
+    }
+    checkpoint = Checkpoint(args.checkpoint, {**options, 'since': args.since.isoformat() if args.since else None})
+    if args.restart:
+        checkpoint.clear()
+    checkpoint.load()
+    if checkpoint.last_id:
+        print(f"Resuming after image {checkpoint.last_id}")
+
+    plans = load_plans()
+    started = time.monotonic()
+    processed = failed = 0
+
+    def write(rows, pending):
+        nonlocal processed, failed
+        floor_ids = {row.id: row.floor_id for row in rows}
+        results = []
+        for image_id, sections, error in pending.get():
+            if error:
+                failed += 1
+                print(f"Image {image_id}: {error}", file=sys.stderr)
+                continue
+            floor_id = floor_ids.get(image_id)
+            results.append((floor_id, image_id, sections, plans.get(floor_id, plans[None])[1]))
+        AnalysisService.apply_many(results)
+        db.session.commit()
+        checkpoint.save(rows[-1].id)
+
+        processed += len(rows)
+        elapsed = time.monotonic() - started
+        print(f"{processed} images ({failed} failed) up to id {rows[-1].id}, {processed / elapsed:.1f} images/s")
+
+    with Pool(args.processes) as pool:
+        previous = None
+        for rows in batches(checkpoint.last_id, args.since, args.batch_size):
+            tasks = [
+                (row.id, blob_store.path(row.sha256), {**plans.get(row.floor_id, plans[None])[0], **options})
+                for row in rows
+            ]
+            pending = pool.map_async(run_task, tasks, chunksize=max(1, len(tasks) // (args.processes * 4)))
+            # Write the previous batch while the pool works on this one.
+            if previous:
+                write(*previous)
+            previous = (rows, pending)
+        if previous:
+            write(*previous)
+
+    elapsed = time.monotonic() - started
+    rate = processed / elapsed if elapsed else 0
+    print(f"Done: {processed} images, {failed} failed in {elapsed:.1f}s ({rate:.1f} images/s)")
+    checkpoint.clear()
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        reanalyze(parse_args(sys.argv[1:]))
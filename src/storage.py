@@ -0,0 +1,138 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import tempfile
+
+from config import BLOB_STORAGE_PATH
+
+CHUNK_SIZE = 64 * 1024
+
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def sniff_mime_type(data):
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def decode_base64_image(image_base64):
+    """
+    Decodes a base64 upload, accepting an optional `data:<mime>;base64,` prefix.
+
+    Returns:
+        (bytes, str): The decoded payload and its mime type.
+    """
+    mime_type = None
+    if image_base64.startswith('data:'):
+        header, _, image_base64 = image_base64.partition(',')
+        mime_type = header[len('data:'):].split(';')[0] or None
+
+    try:
+        data = base64.b64decode(image_base64, validate=False)
+    except (binascii.Error, ValueError):
+        raise Exception("Invalid image_base64")
+
+    return data, mime_type or sniff_mime_type(data)
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class EmptyBlob(Exception):
+    pass
+
+
+class BlobStore():
+    """
+    Content-addressed file store. Blobs are keyed by the SHA-256 of their
+    contents and laid out as `<root>/ab/cd/abcd...` so identical uploads are
+    only written once.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        digest, _ = self.put_stream(io.BytesIO(data))
+        return digest
+
+    def put_stream(self, stream, max_bytes=None, allow_empty=True, chunk_size=CHUNK_SIZE):
+        """
+        Copies `stream` into the store in chunks, hashing as it goes, so the
+        payload is never held in memory as a whole. Raises BlobTooLarge past
+        `max_bytes`, and EmptyBlob for an empty stream unless `allow_empty`.
+
+        Returns:
+            (str, int): The SHA-256 digest and size in bytes of the blob.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"Image exceeds {max_bytes} bytes")
+                    hasher.update(chunk)
+                    f.write(chunk)
+            if not size and not allow_empty:
+                raise EmptyBlob("Missing image")
+
+            digest = hasher.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return digest, size
+
+    def head(self, digest, size=16):
+        with self.open(digest) as f:
+            return f.read(size)
+
+    def open(self, digest):
+        try:
+            return open(self.path(digest), 'rb')
+        except FileNotFoundError:
+            raise Exception("Image blob not found")
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+blob_store = BlobStore(BLOB_STORAGE_PATH)
@@ -0,0 +1,141 @@
+import io
+import os
+import tempfile
+import threading
+
+from config import DERIVATIVE_CACHE_PATH, DERIVATIVE_CACHE_MAX_BYTES
+from storage import blob_store
+
+# name: (longest edge in px, Pillow format, mime type, save options)
+VARIANTS = {
+    '128': (128, 'JPEG', 'image/jpeg', {'quality': 75, 'optimize': True}),
+    '512': (512, 'JPEG', 'image/jpeg', {'quality': 80, 'optimize': True}),
+    'preview': (1600, 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+}
+
+
+class VariantError(Exception):
+    pass
+
+
+def render_variant(data, variant):
+    # Imported on first use so web workers that never resize start faster.
+    from PIL import Image, ImageOps
+
+    max_edge, image_format, _, options = VARIANTS[variant]
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Lets the JPEG decoder downscale by 1/2..1/8 while decoding.
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, image_format, **options)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise VariantError(f"Image cannot be resized: {e}")
+
+    return output.getvalue()
+
+
+class DerivativeCache():
+    """
+    On-disk cache of resized image variants keyed by blob SHA-256. File
+    mtimes record last use, and the least recently used files are removed
+    once the directory grows past `max_bytes`.
+    """
+    def __init__(self, root, max_bytes):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+
+    def path(self, digest, variant):
+        extension = VARIANTS[variant][1].lower()
+        return os.path.join(self.root, digest[:2], f'{digest}-{variant}.{extension}')
+
+    def mime_type(self, variant):
+        return VARIANTS[variant][2]
+
+    def get(self, digest, variant, data=None):
+        """
+        Returns the path of the variant, rendering it from the original blob
+        (or from `data` when the caller already holds the bytes) if missing.
+        """
+        path = self.path(digest, variant)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        if data is None:
+            data = blob_store.read(digest)
+        rendered = render_variant(data, variant)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(rendered)
+        os.replace(tmp_path, path)
+
+        self.track(len(rendered))
+        return path
+
+    def generate_all(self, digest, data=None):
+        if data is None:
+            data = blob_store.read(digest)
+        for variant in VARIANTS:
+            self.get(digest, variant, data)
+
+    def delete(self, digest):
+        for variant in VARIANTS:
+            try:
+                os.remove(self.path(digest, variant))
+            except FileNotFoundError:
+                pass
+
+    def track(self, added_bytes):
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan_size()
+            else:
+                self.size += added_bytes
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def scan(self):
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def scan_size(self):
+        return sum(size for _, size, _ in self.scan())
+
+    def evict(self):
+        # Other workers write to the same directory, so re-read it rather
+        # than trusting this process's running total.
+        entries = sorted(self.scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size = total
+
+
+derivative_cache = DerivativeCache(DERIVATIVE_CACHE_PATH, DERIVATIVE_CACHE_MAX_BYTES)
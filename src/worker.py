@@ -0,0 +1,94 @@
+"""
+Background image analysis worker.
+
+Polls the `analysis_job` table and runs the analysis pipeline in a process
+pool, so uploads return as soon as the image is stored. Run it next to the
+web server:
+
+    cd src && python worker.py
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import analysis
+from analysis import AnalysisError, analyze_image
+from blueprints.services import AnalysisJobService, AnalysisService
+from config import ANALYSIS_JOB_TIMEOUT, ANALYSIS_POLL_INTERVAL, ANALYSIS_WORKERS
+from metrics import observe_analysis_stage
+from storage import blob_store
+
+logger = logging.getLogger('osheet.worker')
+
+
+def run_job(path, options):
+    analysis.stage_observer = observe_analysis_stage
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    return analyze_image(data, **options)
+
+
+class Worker():
+    def __init__(self, app, max_workers=ANALYSIS_WORKERS, poll_interval=ANALYSIS_POLL_INTERVAL):
+        self.app = app
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.in_flight = {}
+
+    def submit(self, pool, job):
+        options, layout_ids = AnalysisService.plan(job.floor)
+        base_analysis = job.base_image.analysis if job.cells is not None and job.base_image else None
+        # A recalibrated floor's old sections no longer line up with its grid.
+        if base_analysis and len(base_analysis.sections) == len(layout_ids):
+            options['cells'] = job.cells
+            options['base_sections'] = base_analysis.sections
+        future = pool.submit(run_job, blob_store.path(job.image.sha256), options)
+        self.in_flight[future] = (job.id, layout_ids)
+
+    def finish(self, future):
+        job_id, layout_ids = self.in_flight.pop(future)
+        try:
+            sections = future.result()
+        except Exception as e:
+            logger.warning("Analysis job %s failed: %s", job_id, e)
+            # Undecodable images fail the same way on every attempt.
+            AnalysisJobService.fail(job_id, str(e), retry=not isinstance(e, AnalysisError))
+            return
+
+        AnalysisJobService.complete(job_id, sections, layout_ids)
+        logger.info("Analysis job %s done", job_id)
+
+    def run_once(self, pool):
+        while len(self.in_flight) < self.max_workers:
+            job = AnalysisJobService.claim_next()
+            if not job:
+                break
+            self.submit(pool, job)
+
+        if not self.in_flight:
+            return False
+
+        done, _ = wait(self.in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+        for future in done:
+            self.finish(future)
+
+        return True
+
+    def run(self):
+        with self.app.app_context(), ProcessPoolExecutor(self.max_workers) as pool:
+            last_requeue = 0
+            while True:
+                if time.monotonic() - last_requeue > ANALYSIS_JOB_TIMEOUT / 2:
+                    AnalysisJobService.requeue_stale(ANALYSIS_JOB_TIMEOUT)
+                    last_requeue = time.monotonic()
+
+                if not self.run_once(pool):
+                    time.sleep(self.poll_interval)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    Worker(app).run()